@@ -0,0 +1,187 @@
+import math
+from array import array
+
+# bits of Kinematics.flags, set once a quantity has been replicated
+LOCATION = 1
+ROTATION = 2
+LINEAR_VELOCITY = 4
+ANGULAR_VELOCITY = 8
+
+# an int8 rotator component is a fraction of a full turn
+INT8_ROTATOR_TO_RADIANS = math.pi / 128
+
+
+class Actor:
+    """A live replicated actor; kinematics live in Kinematics at self.slot."""
+
+    __slots__ = (
+        "slot",
+        "object_id",
+        "object_name",
+        "name_id_name",
+        "created_at_frame",
+        "parent_ids",
+        "handlers",
+        "team",
+        "boost",
+        "player_name",
+        "speed",
+        "angle",
+        "distance_to_ball",
+        "attributes",
+    )
+
+    def __init__(self, slot, object_id, object_name, name_id_name, created_at_frame, handlers):
+        self.slot = slot
+        self.object_id = object_id
+        self.object_name = object_name
+        self.name_id_name = name_id_name
+        self.created_at_frame = created_at_frame
+        self.parent_ids = []
+        self.handlers = handlers
+        self.team = -1
+        self.boost = 255
+        self.player_name = None
+        self.speed = 0
+        self.angle = 0.0
+        self.distance_to_ball = 0
+        # everything without a slot of its own, e.g. loadouts or pickups
+        self.attributes = {}
+
+    def __getstate__(self):
+        # handlers is the parser's shared per-object cache, which holds
+        # closures; ReplayParse.restore() links it again
+        return tuple(
+            None if name == "handlers" else getattr(self, name)
+            for name in self.__slots__
+        )
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class Kinematics:
+    """Location, rotation and velocities of all live actors in flat arrays.
+
+    Slot i owns location[3*i:3*i+3], rotation[4*i:4*i+4] (a quaternion),
+    linear_velocity[3*i:3*i+3] and angular_velocity[3*i:3*i+3]. flags[i]
+    records which of them have been replicated for the actor in slot i.
+    Slots of destroyed actors are reused by the next spawn.
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = 0
+        self.location = array("d")
+        self.rotation = array("d")
+        self.linear_velocity = array("d")
+        self.angular_velocity = array("d")
+        self.flags = bytearray()
+        self.free_slots = []
+        self.next_slot = 0
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        extra = capacity - self.capacity
+        self.location.frombytes(bytes(3 * 8 * extra))
+        self.rotation.frombytes(bytes(4 * 8 * extra))
+        self.linear_velocity.frombytes(bytes(3 * 8 * extra))
+        self.angular_velocity.frombytes(bytes(3 * 8 * extra))
+        self.flags.extend(bytes(extra))
+        self.capacity = capacity
+
+    def allocate(self):
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = self.next_slot
+            self.next_slot += 1
+            if slot >= self.capacity:
+                self.grow(2 * self.capacity)
+        self.flags[slot] = 0
+        return slot
+
+    def release(self, slot):
+        self.flags[slot] = 0
+        self.free_slots.append(slot)
+
+    def set_location(self, slot, vector):
+        i = 3 * slot
+        location = self.location
+        location[i] = vector["x"]
+        location[i + 1] = vector["y"]
+        location[i + 2] = vector["z"]
+        self.flags[slot] |= LOCATION
+
+    def set_quaternion(self, slot, quaternion):
+        i = 4 * slot
+        rotation = self.rotation
+        rotation[i] = quaternion["x"]
+        rotation[i + 1] = quaternion["y"]
+        rotation[i + 2] = quaternion["z"]
+        rotation[i + 3] = quaternion["w"]
+        self.flags[slot] |= ROTATION
+
+    def set_rotator(self, slot, rotator):
+        """Stores a spawn-time int8 (pitch, yaw, roll) rotator as a quaternion."""
+        half = INT8_ROTATOR_TO_RADIANS / 2
+        pitch = (rotator.get("x") or 0) * half
+        yaw = (rotator.get("y") or 0) * half
+        roll = (rotator.get("z") or 0) * half
+        sp, cp = math.sin(pitch), math.cos(pitch)
+        sy, cy = math.sin(yaw), math.cos(yaw)
+        sr, cr = math.sin(roll), math.cos(roll)
+        self.set_quaternion(slot, {
+            "x": cr * sp * sy - sr * cp * cy,
+            "y": -cr * sp * cy - sr * cp * sy,
+            "z": cr * cp * sy - sr * sp * cy,
+            "w": cr * cp * cy + sr * sp * sy,
+        })
+
+    def set_rigid_body(self, slot, rigid_body_state):
+        self.set_location(slot, rigid_body_state["location"])
+        rotation = rigid_body_state["rotation"]
+        # older replays send a compressed rotator, which is not decoded
+        if "quaternion" in rotation:
+            self.set_quaternion(slot, rotation["quaternion"])
+        vector = rigid_body_state.get("linear_velocity")
+        if vector is not None:
+            i = 3 * slot
+            velocity = self.linear_velocity
+            velocity[i] = vector["x"]
+            velocity[i + 1] = vector["y"]
+            velocity[i + 2] = vector["z"]
+            self.flags[slot] |= LINEAR_VELOCITY
+        vector = rigid_body_state.get("angular_velocity")
+        if vector is not None:
+            i = 3 * slot
+            velocity = self.angular_velocity
+            velocity[i] = vector["x"]
+            velocity[i + 1] = vector["y"]
+            velocity[i + 2] = vector["z"]
+            self.flags[slot] |= ANGULAR_VELOCITY
+
+    def get_location(self, slot):
+        if not self.flags[slot] & LOCATION:
+            return None, None, None
+        i = 3 * slot
+        return self.location[i], self.location[i + 1], self.location[i + 2]
+
+    def get_rotation(self, slot):
+        if not self.flags[slot] & ROTATION:
+            return None, None, None, None
+        i = 4 * slot
+        rotation = self.rotation
+        return rotation[i], rotation[i + 1], rotation[i + 2], rotation[i + 3]
+
+    def get_linear_velocity(self, slot):
+        if not self.flags[slot] & LINEAR_VELOCITY:
+            return None, None, None
+        i = 3 * slot
+        return self.linear_velocity[i], self.linear_velocity[i + 1], self.linear_velocity[i + 2]
+
+    def get_angular_velocity(self, slot):
+        if not self.flags[slot] & ANGULAR_VELOCITY:
+            return None, None, None
+        i = 3 * slot
+        return self.angular_velocity[i], self.angular_velocity[i + 1], self.angular_velocity[i + 2]
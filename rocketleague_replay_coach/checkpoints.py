@@ -0,0 +1,158 @@
+import bisect
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+from rattleplayer import RattlePlayer
+from replay_parse import CSV_FIELDS
+from timeline import Timeline, concatenate
+
+
+class ReplayCheckpoints:
+    """Parser snapshots at chosen frames of one replay json, for random access.
+
+    The checkpoint of frame k is the parser state before frame k is applied.
+    Checkpoints sit on the replay's key frames, or every every_seconds of
+    game time, and are taken in one sequential pass when none are given.
+    After that seek() and window() start from the closest checkpoint rather
+    than frame 0, and decode_parallel() decodes the spans between
+    checkpoints in separate processes. save() keeps the snapshots for later
+    runs; they are only valid for the parser code that took them.
+    """
+
+    def __init__(self, file_name, every_seconds=None, fields=CSV_FIELDS, snapshots=None, validation="sampled"):
+        self.file_name = file_name
+        self.fields = fields
+        self.player = RattlePlayer(file_name, fields, validation=validation)
+        self.game = self.player.game
+        self.frames = self.player.frames()
+        self.times = [frame["time"] for frame in self.frames]
+        self.snapshots = {}
+        self.checkpoints = []
+        if snapshots is None:
+            self.take_snapshots(self.checkpoint_frames(every_seconds))
+        else:
+            for frame_index, snapshot in snapshots.items():
+                self.add(frame_index, snapshot)
+
+    @classmethod
+    def load(cls, file_name, path, fields=CSV_FIELDS):
+        """Reads the checkpoints save() wrote for file_name."""
+        with open(path, "rb") as f:
+            snapshots = pickle.load(f)
+        return cls(file_name, fields=fields, snapshots=snapshots)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self.snapshots, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def checkpoint_frames(self, every_seconds=None):
+        """Frame indices to checkpoint: key frames, or every every_seconds."""
+        if every_seconds is None:
+            key_frames = self.player.json_content["content"]["body"].get("key_frames") or []
+            frame_indices = {key_frame["frame"] for key_frame in key_frames}
+        else:
+            frame_indices = set()
+            next_time = None
+            for i, time in enumerate(self.times):
+                if next_time is None or time >= next_time:
+                    frame_indices.add(i)
+                    next_time = time + every_seconds
+        # frame 0 is always there, so every frame has a checkpoint before it
+        frame_indices.add(0)
+        return sorted(i for i in frame_indices if i < len(self.frames))
+
+    def take_snapshots(self, frame_indices):
+        wanted = set(frame_indices)
+        for i, frame in enumerate(self.frames):
+            if i in wanted:
+                self.add(i, self.game.snapshot())
+            self.game.update(i, frame)
+
+    def add(self, frame_index, snapshot):
+        if frame_index not in self.snapshots:
+            bisect.insort(self.checkpoints, frame_index)
+        self.snapshots[frame_index] = snapshot
+
+    def frame_at(self, time):
+        """Index of the last frame at or before time, 0 before the first."""
+        return max(bisect.bisect_right(self.times, time) - 1, 0)
+
+    def advance_to(self, frame_index, derive=True):
+        """Restores the closest checkpoint and applies frames up to frame_index, exclusive."""
+        checkpoint = self.checkpoints[bisect.bisect_right(self.checkpoints, frame_index) - 1]
+        self.game.restore(self.snapshots[checkpoint])
+        for i in range(checkpoint, frame_index):
+            self.game.update(i, self.frames[i], derive)
+
+    def seek(self, time):
+        """Returns the parser as it was after the last frame at or before time."""
+        frame_index = self.frame_at(time)
+        self.advance_to(frame_index)
+        self.game.update(frame_index, self.frames[frame_index])
+        return self.game
+
+    def decode(self, start, end):
+        """Returns a Timeline of frames start to end, exclusive."""
+        self.advance_to(start, derive=False)
+        timeline = Timeline(end - start)
+        for i in range(start, end):
+            self.game.update(i, self.frames[i], derive=False)
+            timeline.record(i - start, self.game)
+        timeline.finish(end - start)
+        return timeline
+
+    def window(self, start_time, end_time):
+        """Returns a Timeline of the frames from start_time to end_time.
+
+        Both times are clamped to the replay, so a window reaching past its
+        start or end is cut short.
+        """
+        start_time = min(max(start_time, self.times[0]), self.times[-1])
+        end_time = min(max(end_time, start_time), self.times[-1])
+        return self.decode(self.frame_at(start_time), self.frame_at(end_time) + 1)
+
+    def goal_window(self, goal, before=5.0, after=2.0):
+        """Returns a Timeline around the goal-th entry of the header's Goals."""
+        goals = self.game.find_array_property("Goals")
+        if not 0 <= goal < len(goals):
+            raise ValueError(f"goal {goal} out of range, {self.file_name} has {len(goals)} goals")
+        frame = goals[goal]["frame"]
+        if not 0 <= frame < len(self.times):
+            raise ValueError(
+                f"goal {goal} is at frame {frame}, {self.file_name} has {len(self.times)} frames"
+            )
+        time = self.times[frame]
+        return self.window(time - before, time + after)
+
+    def decode_parallel(self, workers=None):
+        """Decodes the whole replay into a Timeline, one checkpoint span per task."""
+        workers = workers or os.cpu_count() or 1
+        bounds = self.checkpoints + [len(self.frames)]
+        segments = [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(self.file_name, self.fields),
+        ) as executor:
+            timelines = list(executor.map(
+                decode_segment,
+                [self.snapshots[start] for start, _ in segments],
+                [start for start, _ in segments],
+                [end for _, end in segments],
+            ))
+        return concatenate(timelines)
+
+
+# the replay a decode_parallel() worker process loaded, see init_worker()
+worker_replay = None
+
+
+def init_worker(file_name, fields):
+    global worker_replay
+    worker_replay = ReplayCheckpoints(file_name, fields=fields, snapshots={}, validation="off")
+
+
+def decode_segment(snapshot, start, end):
+    worker_replay.add(start, snapshot)
+    return worker_replay.decode(start, end)
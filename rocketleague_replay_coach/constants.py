@@ -24,6 +24,7 @@ CAR_ELEVATION_OCTANE = 17.01
 CAR_ELEVATION_DOMINUS = 17.05
 CAR_ELEVATION_BREAKOUT = 18.33
 CAR_ELEVATION_BATMOBILE = 18.65
+CAR_SUPERSONIC_SPEED = 2_200.0
 
 # map
 MAP_WALL_DISTANCE_Y = 5_120.0
@@ -32,6 +33,11 @@ MAP_CORNER_SIZE = 1_152.0
 MAP_HALF_GOAL_WIDTH = 892.755
 MAP_GOAL_DEPTH = 880.0
 MAP_OUTER_BOUND = 7_000.0
+# center of the goal line defended by team 0 and team 1
+GOAL_LOCATIONS = [
+    [0.0, -MAP_WALL_DISTANCE_Y, 0.0],
+    [0.0,  MAP_WALL_DISTANCE_Y, 0.0]
+]
 
 # boost pads
 SMALL_BOOST_HEIGHT = 165.0
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+from constants import *
+
+# a velocity change this large within a frame is a hit, and that frame is
+# always kept; smaller changes add to the sample rate in proportion
+HIT_VELOCITY_CHANGE = BALL_HIT_BALL_ANGLE_CHANGE_THRESHOLD
+
+# turning by this angle counts as much as a hit, below BALL_HIT_BALL_SPEED
+# the direction of a car or the ball is noise
+TURN_ANGLE = np.pi / 2
+
+# cars closer to the ball than this add to the sample rate, the most at
+# BALL_HIT_CAR_TO_BALL_DISTANCE and below
+PROXIMITY_RANGE = 4 * BALL_HIT_CAR_TO_BALL_DISTANCE
+
+# how much faster than quiet play the busiest moments are sampled
+ACTIVITY_GAIN = 4.0
+
+
+def moved_velocity(time, position):
+    """Velocity from positions, taken between the frames an entity moved in.
+
+    Replicated positions repeat when no update arrived, which would make
+    frame to frame differences alternate between zero and twice the speed.
+    """
+    velocity = np.full(position.shape, np.nan)
+    for entity in range(position.shape[1]):
+        frames = np.flatnonzero(~np.isnan(position[:, entity, 0]))
+        if len(frames) < 2:
+            continue
+        steps = np.any(np.diff(position[frames, entity], axis=0) != 0, axis=1)
+        moved = np.concatenate([frames[:1], frames[1:][steps]])
+        if len(moved) < 2:
+            continue
+        dt = np.diff(time[moved])[:, None]
+        dt[dt == 0] = np.nan
+        velocity[moved[1:], entity] = np.diff(position[moved, entity], axis=0) / dt
+        # hold each velocity until the next move, within the entity's frames
+        held = pd.DataFrame(velocity[frames, entity]).ffill().to_numpy()
+        velocity[frames, entity] = held
+    return velocity
+
+
+def activity(time, position, velocity=None, distance_to_ball=None):
+    """Returns (activity, hit) per frame from [frame, entity, ...] arrays.
+
+    activity is 0 in quiet play and grows with velocity changes, turns and
+    cars near the ball; hit marks frames with a hit-sized velocity change.
+    velocity, where given and not NaN, is used instead of moved_velocity().
+    """
+    estimated = moved_velocity(time, position)
+    if velocity is not None:
+        estimated = np.where(np.isnan(velocity), estimated, velocity)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        change = np.zeros(position.shape[:2])
+        change[1:] = np.linalg.norm(np.diff(estimated, axis=0), axis=2)
+
+        speed = np.linalg.norm(estimated, axis=2)
+        cosine = np.zeros(position.shape[:2])
+        cosine[1:] = np.sum(estimated[1:] * estimated[:-1], axis=2) / (speed[1:] * speed[:-1])
+        turn = np.arccos(np.clip(cosine, -1.0, 1.0))
+        turn[(speed < BALL_HIT_BALL_SPEED) | np.roll(speed < BALL_HIT_BALL_SPEED, 1, axis=0)] = 0.0
+        turn[0] = 0.0
+
+        score = np.nan_to_num(change / HIT_VELOCITY_CHANGE) + np.nan_to_num(turn / TURN_ANGLE)
+        if distance_to_ball is not None:
+            proximity = (PROXIMITY_RANGE - distance_to_ball) / (PROXIMITY_RANGE - BALL_HIT_CAR_TO_BALL_DISTANCE)
+            score += np.nan_to_num(np.clip(proximity, 0.0, 1.0))
+
+    hit = np.any(np.nan_to_num(change) > HIT_VELOCITY_CHANGE, axis=1)
+    return score.max(axis=1, initial=0.0), hit
+
+
+def adaptive_frames(time, position, velocity=None, distance_to_ball=None, quiet_interval=1.0, min_interval=0.1):
+    """Returns the indices of the frames to keep, densest where play is busy.
+
+    Quiet play is sampled every quiet_interval seconds, busier play up to
+    1 + ACTIVITY_GAIN times as often but never closer than min_interval.
+    The first and last frames are kept, and the first hit in every
+    min_interval.
+    """
+    num_frames = len(time)
+    if num_frames <= 2:
+        return np.arange(num_frames)
+
+    score, hit = activity(time, position, velocity, distance_to_ball)
+    rate = np.minimum((1 + ACTIVITY_GAIN * np.minimum(score, 1.0)) / quiet_interval, 1 / min_interval)
+    dt = np.diff(time, prepend=time[0])
+    samples = np.floor(np.cumsum(rate * dt))
+
+    keep = np.diff(samples, prepend=-1) > 0
+    # hits bypass the rate, but not min_interval
+    slots = np.floor((time - time[0]) / min_interval)
+    hit_slots = np.maximum.accumulate(np.where(hit, slots, -1))
+    keep |= hit & (np.diff(hit_slots, prepend=-1) > 0)
+    keep[[0, -1]] = True
+    return np.flatnonzero(keep)
+
+
+def adaptive_sample(match, quiet_interval=1.0, min_interval=0.1):
+    """Keeps the rows of a loaded match at the frames adaptive_frames() picks."""
+    times, frame_of_row = np.unique(match["time"].to_numpy(dtype=float), return_inverse=True)
+    entity_of_row, entities = pd.factorize(match["player_name"])
+    shape = (len(times), len(entities))
+
+    position = np.full(shape + (3,), np.nan)
+    position[frame_of_row, entity_of_row] = match[["location_x", "location_y", "location_z"]].to_numpy(dtype=float)
+    velocity = np.full(shape + (3,), np.nan)
+    velocity[frame_of_row, entity_of_row] = match[
+        ["linear_velocity_x", "linear_velocity_y", "linear_velocity_z"]
+    ].to_numpy(dtype=float)
+    distance_to_ball = np.full(shape, np.nan)
+    distance_to_ball[frame_of_row, entity_of_row] = match["distance_to_ball"].to_numpy(dtype=float)
+
+    frames = adaptive_frames(times, position, velocity, distance_to_ball, quiet_interval, min_interval)
+    kept = np.zeros(len(times), dtype=bool)
+    kept[frames] = True
+    return match[kept[frame_of_row]]
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import time
+
+
+class ResponseCache:
+    """Completions on disk, keyed by a hash of model, prompt and parameters.
+
+    Each response is a small json file; an entry older than ttl seconds is
+    a miss and gets removed. evict() drops the least recently used entries
+    above max_bytes. Writes go through a temporary file and a rename, so
+    parallel analyzers can share one cache.
+    """
+
+    def __init__(self, cache_dir, ttl=30 * 24 * 3600, max_bytes=256 << 20):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, model, prompt, params):
+        request = json.dumps({"model": model, "prompt": prompt, "params": params}, sort_keys=True)
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached response, or None on a miss."""
+        path = self.entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            self.remove(path)
+            return None
+        # the mtime is the last use, see evict()
+        os.utime(path)
+        return entry["response"]
+
+    def put(self, key, model, response):
+        path = self.entry_path(key)
+        partial_path = f"{path}.{os.getpid()}.partial"
+        with open(partial_path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "model": model, "response": response}, f)
+        os.replace(partial_path, path)
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Removes expired entries, then the least recently used above max_bytes."""
+        entries = []
+        total = 0
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            stat = entry.stat()
+            # mtime is refreshed on use, so now - mtime never overstates the age
+            if now - stat.st_mtime > self.ttl:
+                self.remove(entry.path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import random
+
+import openai
+from openai import AsyncOpenAI
+
+# errors worth another attempt; anything else fails the request at once
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+class LLMRequestError(Exception):
+    """A completion failed for good, after any retries."""
+
+
+class LLMScheduler:
+    """Runs chat completions concurrently with retries and timeouts.
+
+    At most concurrency requests are in flight. A request that times out,
+    is rate limited or hits a server error is retried after an exponential,
+    jittered backoff, or after the Retry-After the server asked for.
+    complete_all() returns results in the order of the prompts. Set
+    OPENAI_BASE_URL to point it at mock_openai.py or another compatible
+    server. With a ResponseCache, prompts answered before are not sent.
+    """
+
+    def __init__(
+        self,
+        model="gpt-4o",
+        concurrency=None,
+        timeout=None,
+        max_retries=None,
+        backoff=1.0,
+        max_backoff=60.0,
+        client_factory=None,
+        cache=None,
+    ):
+        self.model = model
+        self.concurrency = concurrency or int(os.getenv("RL_LLM_CONCURRENCY", 4))
+        self.timeout = timeout or float(os.getenv("RL_LLM_TIMEOUT", 120))
+        self.max_retries = int(os.getenv("RL_LLM_RETRIES", 5)) if max_retries is None else max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache = cache
+        # retries and timeouts are handled here, not by the client
+        self.client_factory = client_factory or (
+            lambda: AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)
+        )
+
+    def complete_all(self, prompts, **params):
+        """Returns the completion of each prompt, None where it failed."""
+        return asyncio.run(self.run(prompts, **params))
+
+    async def run(self, prompts, **params):
+        completions = [None] * len(prompts)
+        # indices of each prompt still to send, a repeated prompt goes once
+        missing = {}
+        for i, prompt in enumerate(prompts):
+            if self.cache is not None:
+                completions[i] = self.cache.get(self.cache.key(self.model, prompt, params))
+            if completions[i] is None:
+                missing.setdefault(prompt, []).append(i)
+        if not missing:
+            return completions
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        client = self.client_factory()
+        try:
+            results = await asyncio.gather(
+                *[self.complete(client, semaphore, prompt, **params) for prompt in missing],
+                return_exceptions=True,
+            )
+        finally:
+            await client.close()
+
+        for (prompt, indices), result in zip(missing.items(), results):
+            if isinstance(result, Exception):
+                print(f"Error while fetching completion {indices[0] + 1} of {len(prompts)}: {result}")
+                continue
+            for i in indices:
+                completions[i] = result
+            if self.cache is not None:
+                self.cache.put(self.cache.key(self.model, prompt, params), self.model, result)
+        if self.cache is not None:
+            self.cache.evict()
+        return completions
+
+    async def complete(self, client, semaphore, prompt, **params):
+        attempt = 0
+        while True:
+            async with semaphore:
+                try:
+                    response = await asyncio.wait_for(
+                        client.chat.completions.create(
+                            model=self.model,
+                            messages=[{"role": "user", "content": prompt}],
+                            **params,
+                        ),
+                        self.timeout,
+                    )
+                    return response.choices[0].message.content or ""
+                except RETRYABLE_ERRORS as e:
+                    if attempt >= self.max_retries:
+                        reason = str(e) or f"no response within {self.timeout}s"
+                        raise LLMRequestError(f"{type(e).__name__} after {attempt + 1} attempts: {reason}") from e
+                    delay = self.retry_delay(attempt, e)
+                except openai.OpenAIError as e:
+                    raise LLMRequestError(f"{type(e).__name__}: {e}") from e
+            # sleep outside the semaphore so other requests can go ahead
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def retry_delay(self, attempt, error):
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                return min(float(response.headers.get("retry-after")), self.max_backoff)
+            except (TypeError, ValueError):
+                pass
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return delay * random.uniform(0.5, 1.0)
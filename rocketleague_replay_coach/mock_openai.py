@@ -0,0 +1,115 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers /v1/chat/completions like the OpenAI API, without a model.
+
+    The reply describes the prompt it was given. Latency and failures are
+    set on the server, see make_server().
+    """
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self.send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        time.sleep(server.latency * random.uniform(0.5, 1.5))
+
+        failure = random.random()
+        if failure < server.rate_limit_rate:
+            self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                           {"Retry-After": str(server.retry_after)})
+            return
+        if failure < server.rate_limit_rate + server.error_rate:
+            self.send_json(500, {"error": {"message": "The server had an error", "type": "server_error"}})
+            return
+
+        prompt = "".join(message.get("content") or "" for message in body.get("messages", []))
+        content = f"Mock feedback for a prompt of {len(prompt)} characters."
+        completion_id = f"chatcmpl-mock-{server.requests}"
+        model = body.get("model", "mock")
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for delta in [{"role": "assistant", "content": ""}, {"content": content}, {}]:
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None if delta else "stop"}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+
+        self.send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (len(prompt) + len(content)) // 4},
+        })
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(port=8000, latency=0.5, rate_limit_rate=0.0, error_rate=0.0, retry_after=1.0):
+    """Returns a mock server; latency is in seconds, the rates are fractions of requests."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockOpenAIHandler)
+    server.latency = latency
+    server.rate_limit_rate = rate_limit_rate
+    server.error_rate = error_rate
+    server.retry_after = retry_after
+    server.requests = 0
+    server.lock = threading.Lock()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat completions API.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per request")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 500")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.latency, args.rate_limit_rate, args.error_rate, args.retry_after)
+    print(f"Mock OpenAI API on http://127.0.0.1:{args.port}/v1, set OPENAI_BASE_URL to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from rattleplayer import SCHEMA_FILE
+
+# modules whose code decides what a parse produces; editing any of them
+# changes PARSER_VERSION and so every cache key
+PARSER_MODULES = [
+    "actors.py",
+    "constants.py",
+    "downsample.py",
+    "rattleplayer.py",
+    "replay_parse.py",
+    "replay_stream.py",
+    "stats_store.py",
+    "timeline.py",
+]
+
+META_FILE = "meta.json"
+
+# a temporary entry this old is left over from a killed worker, even if
+# its pid has been reused since
+STALE_PARTIAL_SECONDS = 3600
+
+
+def file_hash(path, digest=None):
+    """Returns the sha256 hex digest of a file, or feeds it into digest."""
+    own = digest is None
+    if own:
+        digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest() if own else digest
+
+
+def process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def parser_version():
+    digest = hashlib.sha256()
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in PARSER_MODULES:
+        file_hash(os.path.join(module_dir, module), digest)
+    return digest.hexdigest()
+
+
+def schema_version():
+    if not os.path.isfile(SCHEMA_FILE):
+        return "none"
+    return file_hash(SCHEMA_FILE)
+
+
+class ParseCache:
+    """Parsed outputs of replays, keyed by replay content and parser version.
+
+    Each entry is a directory named by its key holding meta.json and copies
+    of the files a parse wrote. Entries are written to a temporary
+    directory and renamed, so concurrent workers never see half an entry.
+    evict() drops the least recently used entries above max_bytes, and
+    the temporary directories of workers that died before renaming them.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = hashlib.sha256(
+            f"{parser_version()}:{schema_version()}".encode()
+        ).hexdigest()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, replay_path):
+        digest = hashlib.sha256(self.version.encode())
+        return file_hash(replay_path, digest).hexdigest()
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """Returns the metadata stored under key, or None on a miss."""
+        meta_path = os.path.join(self.entry_dir(key), META_FILE)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # the mtime of meta.json is the last use, see evict()
+        os.utime(meta_path)
+        return meta
+
+    def restore(self, key, name, path):
+        """Copies the cached file name of entry key to path."""
+        partial_path = path + ".partial"
+        shutil.copyfile(os.path.join(self.entry_dir(key), name), partial_path)
+        os.replace(partial_path, path)
+
+    def put(self, key, meta, paths):
+        """Stores meta and copies of paths, by base name, under key."""
+        entry_dir = self.entry_dir(key)
+        temp_dir = f"{entry_dir}.{os.getpid()}.partial"
+        os.makedirs(temp_dir, exist_ok=True)
+        try:
+            for path in paths:
+                shutil.copyfile(path, os.path.join(temp_dir, os.path.basename(path)))
+            with open(os.path.join(temp_dir, META_FILE), "w") as f:
+                json.dump(meta, f)
+            os.rename(temp_dir, entry_dir)
+        except OSError:
+            # another worker stored the same replay first
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            if not os.path.isdir(entry_dir):
+                raise
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        now = time.time()
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self.entry_dir(key)
+            if key.endswith(".partial"):
+                # <key>.<pid>.partial, see put()
+                pid = key.split(".")[-2]
+                try:
+                    stale = now - os.path.getmtime(entry_dir) > STALE_PARTIAL_SECONDS
+                except FileNotFoundError:
+                    # renamed into place meanwhile
+                    continue
+                if stale or not (pid.isdigit() and process_running(int(pid))):
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            meta_path = os.path.join(entry_dir, META_FILE)
+            if not os.path.isfile(meta_path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+            entries.append((os.path.getmtime(meta_path), size, entry_dir))
+            total += size
+
+        evicted = 0
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            evicted += 1
+        return evicted
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from constants import *
+from downsample import ACTIVITY_GAIN, adaptive_sample
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# characters per token assumed without tiktoken; numbers and separators
+# tokenize worse than prose, so this errs on the side of more tokens
+CHARS_PER_TOKEN = 3.0
+
+# the ball counts as threatening a goal this close to its goal line center
+BALL_NEAR_GOAL_DISTANCE = 1_500.0
+
+# at most this many events are listed, the rest are only counted
+MAX_EVENTS = 40
+
+# finest sampling interval in seconds, about the rate replays are recorded at
+MIN_SAMPLE_INTERVAL = 1 / 30
+
+ROW_SCHEMA = "t;id;x;y;z;kmh;boost"
+
+
+def estimate_tokens(text):
+    """Estimates the gpt-4o tokens of text, exactly when tiktoken is installed."""
+    if tiktoken is not None:
+        return len(tiktoken.get_encoding("o200k_base").encode(text))
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def runs(mask, time):
+    """Returns (start, end) times of the runs where mask is True."""
+    mask = np.asarray(mask, dtype=np.int8)
+    edges = np.diff(np.concatenate([[0], mask, [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    return list(zip(time[starts], time[ends]))
+
+
+def player_legend(match):
+    """Maps player names to the short ids rows use, players by team and name."""
+    players = match[match["player_name"] != "ball"]
+    teams = players.groupby("player_name", observed=True)["team"].last().sort_values(kind="stable")
+    legend = {name: f"p{i}" for i, name in enumerate(teams.index)}
+    legend["ball"] = "b"
+    return legend, teams
+
+
+def summarize(match, legend, teams):
+    """Returns per-player summary lines and a list of (time, event) pairs."""
+    lines = []
+    events = []
+    ball = match[match["player_name"] == "ball"]
+
+    for name, team in teams.items():
+        rows = match[match["player_name"] == name]
+        time = rows["time"].to_numpy()
+        speed = rows["speed"].to_numpy(dtype=float)
+        speed = speed[speed >= 0]
+        distance = rows["distance_to_ball"].to_numpy(dtype=float)
+        # frames without a ball have no distance to it
+        with_ball = distance[rows["time"].isin(ball["time"]).to_numpy() & ~np.isnan(distance)]
+        own_half = rows["location_y"] < 0 if team == 0 else rows["location_y"] > 0
+        touches = runs(distance < BALL_HIT_CAR_TO_BALL_DISTANCE, time)
+        lines.append(
+            f"{legend[name]}={name} team {int(team)}: "
+            f"avg {np.mean(speed) * UU_TO_KMH_FACTOR if len(speed) else 0:.0f} km/h, "
+            f"supersonic {np.mean(speed >= CAR_SUPERSONIC_SPEED) * 100 if len(speed) else 0:.0f}%, "
+            f"avg boost {rows['boost'].astype(float).mean() / 255 * 100:.0f}%, "
+            f"own half {own_half.mean() * 100:.0f}%, "
+            f"avg distance to ball {np.mean(with_ball) if len(with_ball) else 0:.0f} uu, "
+            f"~{len(touches)} ball contacts"
+        )
+        events += [(start, f"{legend[name]} near ball") for start, _ in touches]
+
+    if len(ball):
+        time = ball["time"].to_numpy()
+        location = ball[["location_x", "location_y", "location_z"]].to_numpy(dtype=float)
+        for team, goal in enumerate(GOAL_LOCATIONS):
+            near_goal = np.linalg.norm(location - goal, axis=1) < BALL_NEAR_GOAL_DISTANCE
+            events += [
+                (start, f"ball near team {team} goal until {end:.1f}")
+                for start, end in runs(near_goal, time)
+            ]
+    return lines, sorted(events)
+
+
+def encode_rows(rows, legend, interval=0.1):
+    """Encodes rows as ROW_SCHEMA lines with rounded numbers."""
+    speed = rows["speed"].astype(float)
+    # ball rows carry no boost, -1 when loaded from a .npz
+    boost = rows["boost"].astype(float)
+    encoded = pd.DataFrame({
+        "t": rows["time"].astype(float).round(1 if interval >= 0.1 else 2),
+        "id": rows["player_name"].astype(str).map(legend),
+        # tens of uu keep a car's position to a fraction of its length
+        "x": (rows["location_x"].astype(float) / 10).round().astype("Int64"),
+        "y": (rows["location_y"].astype(float) / 10).round().astype("Int64"),
+        "z": (rows["location_z"].astype(float) / 10).round().astype("Int64"),
+        "kmh": (speed.where(speed >= 0) * UU_TO_KMH_FACTOR).round().astype("Int64"),
+        "boost": (boost.where(boost >= 0) / 255 * 100).round().astype("Int64"),
+    })
+    return encoded.to_csv(sep=";", header=False, index=False)
+
+
+def build_prompt(intro, match, token_budget):
+    """Returns (prompt, estimated tokens) for a match within token_budget.
+
+    Player summaries and events come first; the rest of the budget goes
+    to rows downsampled by adaptive_sample(), with the shortest quiet
+    interval that fits.
+    """
+    match = match.sort_values("time", kind="stable")
+    legend, teams = player_legend(match)
+    summary, events = summarize(match, legend, teams)
+
+    event_lines = [f"{time:.1f} {event}" for time, event in events[:MAX_EVENTS]]
+    if len(events) > MAX_EVENTS:
+        event_lines.append(f"... and {len(events) - MAX_EVENTS} more events")
+
+    header = "\n".join(
+        [intro.strip(), "", "Players:"] + summary
+        + ["", "Events (seconds):"] + event_lines
+        + ["", f"Positions, one row per sample: {ROW_SCHEMA}",
+           "x, y, z in tens of uu (team 0 defends y<0), kmh is car speed, boost in %, id b is the ball.", ""]
+    )
+    header_tokens = estimate_tokens(header)
+    remaining = token_budget - header_tokens
+    if remaining <= 0 or match.empty:
+        return header, header_tokens
+
+    duration = max(match["time"].max() - match["time"].min(), MIN_SAMPLE_INTERVAL)
+    entities = match["player_name"].nunique()
+    row_tokens = estimate_tokens(encode_rows(match.head(50), legend, MIN_SAMPLE_INTERVAL)) / min(len(match), 50)
+    # busy moments are sampled up to 1 + ACTIVITY_GAIN times as often,
+    # start from the middle of that range
+    interval = duration * entities * row_tokens / remaining * (1 + ACTIVITY_GAIN / 2)
+
+    # the estimate is rough, so adjust until the rows fill most of the budget;
+    # the whole prompt is counted, so it never goes over
+    best = None
+    for _ in range(8):
+        interval = max(interval, MIN_SAMPLE_INTERVAL)
+        min_interval = max(interval / (1 + ACTIVITY_GAIN), MIN_SAMPLE_INTERVAL)
+        prompt = (
+            header
+            + f"Sampled every {interval:.2f} s in quiet play, down to {min_interval:.2f} s around hits, turns and the ball.\n"
+            + encode_rows(adaptive_sample(match, interval, min_interval), legend, min_interval)
+        )
+        tokens = estimate_tokens(prompt)
+        rows_tokens = tokens - header_tokens
+        if tokens <= token_budget:
+            best = prompt, tokens
+            if rows_tokens >= 0.85 * remaining or interval == MIN_SAMPLE_INTERVAL:
+                break
+        interval *= rows_tokens / remaining * 1.05
+    if best is None:
+        return header, header_tokens
+    return best
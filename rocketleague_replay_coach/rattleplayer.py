@@ -1,73 +1,169 @@
+from functools import lru_cache
 from json import load as json_load
 from os.path import isfile as os_isfile
 
 from constants import *
-from replay_parse import ReplayParse
-from jsonschema import validate, ValidationError
+from replay_parse import ReplayParse, CSV_FIELDS, CSV_HEADERS
+from replay_stream import ReplayStream
+from timeline import Timeline
+from jsonschema import ValidationError
+from jsonschema.validators import validator_for
+
+SCHEMA_FILE = "schema.json"
+
+# off: nothing, header: the replay header, sampled: the header and every
+# VALIDATION_SAMPLE_RATE-th frame, full: the whole replay
+VALIDATION_MODES = ["off", "header", "sampled", "full"]
+VALIDATION_SAMPLE_RATE = 100
+
+
+class InvalidReplayError(ValueError):
+    """The replay json does not match the rattletrap schema."""
+
+
+@lru_cache(maxsize=None)
+def get_validator(definition):
+    """Returns a validator for one schema definition, built once per process."""
+    with open(SCHEMA_FILE, mode="r", encoding="utf-8") as f:
+        schema = json_load(f)
+    schema["$ref"] = f"#/definitions/{definition}"
+    return validator_for(schema)(schema)
 
 
 class RattlePlayer:
 
-    def __init__(self, file_name):
-        """Create a new RattlePlayer object."""
+    def __init__(self, file_name, fields=CSV_FIELDS, stream=False, validation="sampled"):
+        """Create a new RattlePlayer object.
+
+        fields is the set of attributes to decode, None decodes all of them.
+        With stream, frames are read one at a time instead of loading the
+        whole json, and file_name may also be a .replay run through rattletrap.
+        validation is one of VALIDATION_MODES; a streamed replay has its
+        frames validated as they are read. A streaming RattlePlayer holds a
+        file or a rattletrap process, close() it or use it in a with block.
+        """
 
         self.file_name = file_name
+        self.stream = None
+
+        if validation not in VALIDATION_MODES:
+            raise ValueError(f'Unknown validation mode "{validation}"')
+        self.validation = validation
 
         if not os_isfile(self.file_name):
             raise FileNotFoundError(f'File "{self.file_name}" does not exist')
 
-        if not self.file_name.lower().endswith(".json"):
+        is_replay = stream and self.file_name.lower().endswith(".replay")
+        if not self.file_name.lower().endswith(".json") and not is_replay:
             raise ValueError(f'File "{self.file_name}" is not a json file')
 
         try:
-            with open(self.file_name, mode="r", encoding="utf-8") as f:
-                self.json_content = json_load(f)
+            if is_replay:
+                self.stream = ReplayStream.open_replay(self.file_name)
+            elif stream:
+                self.stream = ReplayStream(
+                    open(self.file_name, mode="r", encoding="utf-8")
+                )
+            else:
+                with open(self.file_name, mode="r", encoding="utf-8") as f:
+                    self.json_content = json_load(f)
         except Exception as e:
             raise ValueError(
                 f'File "{self.file_name}" is not a valid json file'
             ) from e
 
-        self.validate_json_schema(self.json_content)
-        self.game = ReplayParse(self.json_content)
+        if self.stream is not None:
+            self.json_content = {"header": self.stream.header}
+
+        try:
+            if validation == "full" and self.stream is None:
+                self.validate_json_schema(self.json_content)
+            elif validation != "off":
+                self.validate_json_schema(self.json_content["header"], "section-header")
+            if validation == "sampled" and self.stream is None:
+                frames = self.json_content["content"]["body"]["frames"]
+                for i in range(0, len(frames), VALIDATION_SAMPLE_RATE):
+                    self.validate_json_schema(frames[i], "frame", f"frame {i}")
+
+            self.game = ReplayParse(self.json_content, fields)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        """Closes the stream of a streaming RattlePlayer."""
+        if self.stream is not None:
+            self.stream.close()
 
+    def __enter__(self):
+        return self
 
-    def validate_json_schema(self, data):
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def validate_json_schema(self, data, definition="replay", where="replay"):
         try:
-            with open("schema.json", mode="r", encoding="utf-8") as f:
-                validate(instance=data, schema=json_load(f))
+            get_validator(definition).validate(data)
         except ValidationError as e:
-            print(f"JSON data is invalid: {e.message}")
-            exit(-1)
-
-    def generate_csv(self):
-        """Replay the game."""
-        frames = self.json_content["content"]["body"]["frames"]
-
-        headers = [
-            "time",
-            "player_name",
-            "team",
-            "boost",
-            "location_x",
-            "location_y",
-            "location_z",
-            "rotation_x",
-            "rotation_y",
-            "rotation_z",
-            "rotation_w",
-            "linear_velocity_x",
-            "linear_velocity_y",
-            "linear_velocity_z",
-            "angular_velocity_x",
-            "angular_velocity_y",
-            "angular_velocity_z",
-            "speed",
-            "distance_to_ball",
-        ]
-        output = ",".join(headers) + "\n"
+            raise InvalidReplayError(
+                f'File "{self.file_name}" has invalid {where}: {e.message}'
+            ) from e
 
+    def frames(self):
+        """Returns the frames, read one at a time when streaming."""
+        if self.stream is None:
+            return self.json_content["content"]["body"]["frames"]
+        if self.validation in ["sampled", "full"]:
+            return self.validated_frames(self.stream.frames())
+        return self.stream.frames()
+
+    def validated_frames(self, frames):
+        sample_rate = 1 if self.validation == "full" else VALIDATION_SAMPLE_RATE
         for i, frame in enumerate(frames):
+            if i % sample_rate == 0:
+                self.validate_json_schema(frame, "frame", f"frame {i}")
+            yield frame
+
+    def generate_csv(self, file=None, timeline=None):
+        """Replay the game, writing the csv to file as frames are decoded.
+
+        Without a file the whole csv is returned as a string. A timeline
+        given here records the same frames.
+        """
+        if file is None:
+            return "".join(self.iter_csv(timeline=timeline))
+        file.writelines(self.iter_csv(timeline=timeline))
+
+    def iter_csv(self, batch_size=256, timeline=None):
+        """Yields the csv text in batches of batch_size frames."""
+        batch = [",".join(CSV_HEADERS) + "\n"]
+
+        num_frames = 0
+        for i, frame in enumerate(self.frames()):
             self.game.update(i, frame)
-            output += self.game.dump()
+            if timeline is not None:
+                timeline.record(i, self.game)
+            batch.append(self.game.dump())
+            if len(batch) >= batch_size:
+                yield "".join(batch)
+                batch = []
+            num_frames = i + 1
+
+        if batch:
+            yield "".join(batch)
+        if timeline is not None:
+            timeline.finish(num_frames)
+
+    def generate_timeline(self):
+        """Replay the game into a columnar Timeline."""
+        timeline = Timeline(self.game.num_frames)
+
+        num_frames = 0
+        for i, frame in enumerate(self.frames()):
+            self.game.update(i, frame, derive=False)
+            timeline.record(i, self.game)
+            num_frames = i + 1
 
-        return output
+        timeline.finish(num_frames)
+        return timeline
@@ -1,19 +1,88 @@
 import math
+import pickle
+from datetime import date, datetime
 from constants import *
+from actors import Actor, Kinematics, LOCATION, LINEAR_VELOCITY
+
+BALL_TYPES = frozenset([
+    'Archetypes.Ball.Ball_Default',
+    'Archetypes.Ball.Ball_Basketball',
+    'Archetypes.Ball.Ball_Hockey',
+    'Archetypes.Ball.Ball_God'
+])
+
+# attributes read by dump(), plus the ones naming the csv file
+CSV_FIELDS = frozenset([
+    'Engine.Pawn:PlayerReplicationInfo',
+    'Engine.PlayerReplicationInfo:PlayerName',
+    'TAGame.RBActor_TA:ReplicatedRBState',
+    'TAGame.Car_TA:TeamPaint',
+    'TAGame.CarComponent_Boost_TA:ReplicatedBoost',
+    'ProjectX.GRI_X:ReplicatedServerRegion',
+    'ProjectX.GRI_X:ReplicatedGamePlaylist',
+])
+
+# columns of the rows written by dump()
+CSV_HEADERS = [
+    "time",
+    "player_name",
+    "team",
+    "boost",
+    "location_x",
+    "location_y",
+    "location_z",
+    "rotation_x",
+    "rotation_y",
+    "rotation_z",
+    "rotation_w",
+    "linear_velocity_x",
+    "linear_velocity_y",
+    "linear_velocity_z",
+    "angular_velocity_x",
+    "angular_velocity_y",
+    "angular_velocity_z",
+    "speed",
+    "distance_to_ball",
+]
 
 
 class ReplayParse:
 
-    def __init__(self, json_content):
-        self.num_frames = len(json_content["content"]["body"]["frames"])
+    def __init__(self, json_content, fields=None, keep_history=False):
+        """fields limits decoding to the named attributes, None decodes all.
+
+        With keep_history, destroyed actors are archived in self.history.
+        json_content may hold just the header when frames are streamed.
+        """
         self.time = 0.0
         self.current_fps = 0.0
         self.actors = {}
+        self.kinematics = Kinematics()
+        self.players = {}
+        self.car_players = {}
+        self.player_car_pairs = []
+        self.attribute_handlers = {
+            name: handler
+            for name, handler in ATTRIBUTE_HANDLERS.items()
+            if fields is None or name in fields
+        }
+        self.attribute_cache = {}
+        self.keep_history = keep_history
+        self.history = []
         self.properties = json_content["header"]["body"]["properties"][
             "elements"
         ]
         self.map_name = self.find_property("MapName")
+        if "content" in json_content:
+            self.num_frames = len(json_content["content"]["body"]["frames"])
+        else:
+            self.num_frames = self.find_property("NumFrames") or 0
         self.ball_id = None
+        # a destroyed ball stays live until the kickoff spawns the next one
+        self.ball_destroyed = False
+        # actors whose rigid body changed in the current frame
+        self.moved = set()
+        self.calculated_ball_id = None
         self.seconds_remaining = 300
         self.frame_index = 0
         self.game_playlist = None
@@ -23,33 +92,56 @@ class ReplayParse:
     def find_property(self, property_name):
         for element in self.properties:
             if element[0] == property_name:
-                if element[1]['kind'] == 'IntProperty':
-                    return element[1]['value']['int']
-                if element[1]['kind'] == 'StrProperty':
-                    return element[1]['value']['str']
-                if element[1]['kind'] == 'FloatProperty':
-                    return element[1]['value']['float']
-                if element[1]['kind'] == 'NameProperty':
-                    return element[1]['value']['name']
-                return element[1]['value']
+                return property_value(element[1])
         return None
 
+    def find_array_property(self, property_name):
+        """Returns an ArrayProperty such as Goals as a list of dicts."""
+        value = self.find_property(property_name)
+        if value is None:
+            return []
+        return [
+            {name: property_value(prop) for name, prop in struct["elements"]}
+            for struct in value["array"]
+        ]
+
+
+    def snapshot(self):
+        """Returns the state after the current frame as bytes for restore().
+
+        Everything update() changes is included, the header and history
+        are not. Snapshots are independent of the parser and can be stored
+        or sent to another process.
+        """
+        return pickle.dumps({
+            name: getattr(self, name) for name in SNAPSHOT_STATE
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def restore(self, snapshot):
+        """Puts the parser back in the state snapshot() returned."""
+        for name, value in pickle.loads(snapshot).items():
+            setattr(self, name, value)
+        for actor in self.actors.values():
+            actor.handlers = self.attribute_cache.setdefault(actor.object_id, {})
 
-    def update(self, frame_index, frame):
+
+    def update(self, frame_index, frame, derive=True):
+        """Applies frame; derive=False skips the per-frame calculate()."""
 
         self.time = frame["time"]
         delta = frame["delta"]
         self.current_fps = 0 if delta == 0 else 1 / delta
         self.frame_index = frame_index
-
+        self.moved.clear()
 
         self.add_actors(frame["replications"])
         self.update_actors(frame["replications"])
+        self.remove_actors(frame["replications"])
 
         self.player_car_pairs = self.get_player_car_pairs()
-        self.ball_id = self.get_ball()
 
-        self.calculate()
+        if derive:
+            self.calculate()
 
 
     def add_actors(self, actors):
@@ -58,17 +150,31 @@ class ReplayParse:
 
             if "value" in actor and "spawned" in actor["value"]:
                 spawned = actor["value"]["spawned"]
-                a = {}
-                a["object_id"] = spawned.get("object_id", None)
-                a["object_name"] = spawned.get("object_name", None)
-                a["name_id_name"] = spawned.get("name", None)
-                a["created_at_frame"] = self.frame_index
-                a["parent_ids"] = []
-                if "initialization" in spawned:
-                    a["location"] = spawned['initialization']['location']
-                    a["rotation"] = spawned['initialization']['rotation']
+                self.remove_actor(actor_id)
+                object_id = spawned.get("object_id", None)
+                a = Actor(
+                    self.kinematics.allocate(),
+                    object_id,
+                    spawned.get("object_name", None),
+                    spawned.get("name", None),
+                    self.frame_index,
+                    self.attribute_cache.setdefault(object_id, {}),
+                )
+                initialization = spawned.get("initialization")
+                if initialization is not None:
+                    if initialization.get("location") is not None:
+                        self.kinematics.set_location(a.slot, initialization["location"])
+                    if initialization.get("rotation") is not None:
+                        self.kinematics.set_rotator(a.slot, initialization["rotation"])
                 self.actors[actor_id] = a
-                self.parse_object(actor, spawned)
+                self.moved.add(actor_id)
+                if a.object_name == 'TAGame.Default__PRI_TA':
+                    self.players[actor_id] = None
+                elif a.object_name in BALL_TYPES:
+                    # a goal reset spawns a new ball, the newest one is live
+                    if self.ball_destroyed:
+                        self.remove_actor(self.ball_id)
+                    self.ball_id = actor_id
             else:
                 # print(f"Warning: 'spawned' not found for actor {actor_id}. Skipping actor.")
                 continue
@@ -84,318 +190,71 @@ class ReplayParse:
                 continue
 
 
-    def parse_object(self, actor, updated):
-        actor_id = actor["actor_id"]["value"]
-        object_name = updated.get("name", None)
-        object_id = updated.get("id", {}).get("value", None)
-        if object_id is not None:
-            self.actors[actor_id]["object_id"] = object_id
-
-        match object_name:
-
-            case "Engine.Actor:RemoteRole":
-                self.actors[actor_id]["remote_role"] = updated["value"]["enum"]
-
-            case "TAGame.PRI_TA:PersistentCamera":
-                self.actors[actor_id]["parent_ids"].append(
-                    updated["value"]["flagged_int"]["int"]
-                )
-
-            case "TAGame.CameraSettingsActor_TA:PRI":
-                self.actors[actor_id]["parent_ids"].append(
-                    updated["value"]["flagged_int"]["int"]
-                )
-
-            case "TAGame.Ball_TA:GameEvent":
-                self.actors[actor_id]["parent_ids"].append(
-                    updated["value"]["flagged_int"]["int"]
-                )
-
-            case "TAGame.CarComponent_TA:Vehicle":
-                self.actors[actor_id]["parent_ids"].append(
-                    updated["value"]["flagged_int"]["int"]
-                )
+    def remove_actors(self, actors):
+        for actor in actors:
+            if "value" in actor and "destroyed" in actor["value"]:
+                actor_id = actor["actor_id"]["value"]
+                a = self.actors.get(actor_id)
+                # destroys run after spawns, so an id that was destroyed and
+                # respawned within this frame already belongs to the new actor
+                if a is None or a.created_at_frame == self.frame_index:
+                    continue
+                if actor_id == self.ball_id:
+                    # keep the last ball position between a goal and the kickoff
+                    self.ball_destroyed = True
+                else:
+                    self.remove_actor(actor_id)
+
+    def remove_actor(self, actor_id):
+        """Retires actor_id and frees its slot for the next spawn."""
+        a = self.actors.pop(actor_id, None)
+        if a is None:
+            return
+        self.unlink_actor(actor_id)
+        self.kinematics.release(a.slot)
+        if self.keep_history:
+            self.history.append({
+                "actor_id": actor_id,
+                "object_name": a.object_name,
+                "player_name": a.player_name,
+                "created_at_frame": a.created_at_frame,
+                "destroyed_at_frame": self.frame_index,
+            })
 
-            case "Engine.Pawn:PlayerReplicationInfo":
-                self.actors[actor_id]["parent_ids"].append(
-                    updated["value"]["flagged_int"]["int"]
-                )
 
-            case "Engine.PlayerReplicationInfo:Ping":
-                self.actors[actor_id]["active"] = updated["value"]["byte"]
-
-            case "TAGame.CarComponent_Boost_TA:ReplicatedBoost":
-                self.actors[actor_id]["boost"] = updated["value"]["boost"][
-                    "boostAmount"
-                ]
-
-            case "TAGame.PRI_TA:ReplicatedGameEvent":
-                self.actors[actor_id]["time_remaining"] = updated["value"][
-                    "flagged_int"
-                ]["int"]
-
-            case "TAGame.GameEvent_TA:ReplicatedStateName":
-                self.actors[actor_id]["stateName"] = updated["value"]["int"]
-
-            case "TAGame.GameEvent_TA:BotSkill":
-                self.actors[actor_id]["bot_skill"] = updated["value"]["int"]
-
-            case "TAGame.GameEvent_TA:bHasLeaveMatchPenalty":
-                self.actors[actor_id]["has_leave_match_penalty"] = updated[
-                    "value"
-                ]["boolean"]
-
-            case "TAGame.GameEvent_Team_TA:MaxTeamSize":
-                self.actors[actor_id]["max_team_size"] = updated["value"]["int"]
-
-            case "TAGame.GameEvent_Soccar_TA:SecondsRemaining":
-                self.seconds_remaining = updated["value"]["int"]
-                self.actors[actor_id]["seconds_remaining"] = updated["value"][
-                    "int"
-                ]
-
-            case "TAGame.RBActor_TA:ReplicatedRBState":
-                rigid_body_state = updated["value"]["rigid_body_state"]
-                for key in ["location", "rotation", "angular_velocity", "linear_velocity"]:
-                    if key in rigid_body_state and rigid_body_state[key] is not None:
-                        self.actors[actor_id][key] = rigid_body_state[key]
-
-            case "TAGame.Vehicle_TA:ReplicatedSteer":
-                self.actors[actor_id]["steer"] = updated["value"]["byte"]
-
-            case "TAGame.Vehicle_TA:ReplicatedThrottle":
-                self.actors[actor_id]["throttle"] = updated["value"]["byte"]
-
-            case "TAGame.Car_TA:TeamPaint":
-                self.actors[actor_id]["team_paint"] = updated["value"]["team_paint"]
-                self.actors[actor_id]["team"] = updated["value"]["team_paint"]["team"]
-
-            case "TAGame.CameraSettingsActor_TA:CameraYaw":
-                self.actors[actor_id]["camera_yaw"] = updated["value"]["byte"]
-
-            case "TAGame.CameraSettingsActor_TA:CameraPitch":
-                self.actors[actor_id]["camera_pitch"] = updated["value"]["byte"]
-
-            case "TAGame.CameraSettingsActor_TA:ProfileSettings":
-                self.actors[actor_id]["camera_settings"] = updated["value"][
-                    "cam_settings"
-                ]
-
-            case "TAGame.CameraSettingsActor_TA:bUsingSecondaryCamera":
-                self.actors[actor_id]["using_ball_cam"] = updated["value"][
-                    "boolean"
-                ]
-
-            case "Engine.PlayerReplicationInfo:UniqueId":
-                self.actors[actor_id]["unique_id"] = updated["value"][
-                    "unique_id"
-                ]
-
-            case "Engine.PlayerReplicationInfo:Team":
-                self.actors[actor_id]["team"] = updated["value"]["flagged_int"][
-                    "int"
-                ]
-
-            case "Engine.PlayerReplicationInfo:PlayerID":
-                self.actors[actor_id]["player_id"] = updated["value"]["int"]
-
-            case "Engine.PlayerReplicationInfo:PlayerName":
-                self.actors[actor_id]["player_name"] = updated["value"][
-                    "string"
-                ]
-
-            case "Engine.PlayerReplicationInfo:Ping":
-                self.actors[actor_id]["ping"] = updated["value"]["byte"]
-
-            case "TAGame.PRI_TA:CurrentVoiceRoom":
-                self.actors[actor_id]["current_voice_room"] = updated["value"][
-                    "string"
-                ]
-
-            case "TAGame.PRI_TA:SpectatorShortcut":
-                self.actors[actor_id]["spectator_shortcut"] = updated["value"][
-                    "int"
-                ]
-
-            case "TAGame.PRI_TA:SteeringSensitivity":
-                self.actors[actor_id]["steering_sensitivity"] = updated[
-                    "value"
-                ]["float"]
-
-            case "TAGame.PRI_TA:Title":
-                self.actors[actor_id]["title"] = updated["value"]["int"]
-
-            case "TAGame.PRI_TA:PartyLeader":
-                self.actors[actor_id]["party_leader_id"] = updated["value"][
-                    "party_leader"
-                ]["id"]
-
-            case "TAGame.PRI_TA:ClientLoadoutsOnline":
-                self.actors[actor_id]["loadout_online"] = updated["value"][
-                    "loadouts_online"
-                ]
-
-            case "TAGame.PRI_TA:ClientLoadouts":
-                self.actors[actor_id]["team_loadout"] = updated["value"][
-                    "loadouts"
-                ]
-
-            case "TAGame.PRI_TA:ReplicatedGameEvent":
-                other_actor_id = updated["value"]["flagged_int"]["int"]
-                if other_actor_id != -1:
-                    if "frames_with_event" not in self.actors[other_actor_id]:
-                        self.actors[other_actor_id]["frames_with_event"] = []
-                    self.actors[other_actor_id]["frames_with_event"].append(
-                        self.frame_index
-                    )
-
-            case "TAGame.PRI_TA:PlayerHistoryValid":
-                self.actors[actor_id]["player_history_valid"] = updated[
-                    "value"
-                ]["boolean"]
-
-            case "TAGame.GameEvent_Soccar_TA:MaxScore":
-                self.actors[actor_id]["score"] = updated["value"]["int"]
-
-            case "TAGame.CarComponent_Dodge_TA":
-                self.actors[actor_id]["location"] = updated["value"]["Location"]
-
-            case "Engine.GameReplicationInfo:ServerName":
-                self.actors[actor_id]["server"] = updated["value"]["string"]
-
-            case "ProjectX.GRI_X:MatchGuid":
-                self.actors[actor_id]["match_guid"] = updated["value"]["string"]
-
-            case "ProjectX.GRI_X:bGameStarted":
-                self.actors[actor_id]["game_started"] = updated["value"][
-                    "boolean"
-                ]
-
-            case "ProjectX.GRI_X:GameServerID":
-                self.actors[actor_id]["server_id"] = updated["value"][
-                    "game_server"
-                ]["new"]
-
-            case "ProjectX.GRI_X:Reservations":
-                self.actors[actor_id]["reservation"] = updated["value"][
-                    "reservation"
-                ]
-
-            case "ProjectX.GRI_X:ReplicatedServerRegion":
-                self.actors[actor_id]["region"] = updated["value"]["string"]
-                self.game_region = updated["value"]["string"]
-
-            case "ProjectX.GRI_X:ReplicatedGamePlaylist":
-                game_playlist_id = updated["value"]["int"]
-                game_playlist = "unknown"
-
-                if game_playlist_id == GAME_PLAYLIST_CASUAL_DUEL:
-                    game_playlist = "casual_duel"
-                elif game_playlist_id == GAME_PLAYLIST_CASUAL_DOUBLE:
-                    game_playlist = "casual_double"
-                elif game_playlist_id == GAME_PLAYLIST_CASUAL_STANDARD:
-                    game_playlist = "casual_standard"
-                elif game_playlist_id == GAME_PLAYLIST_CASUAL_CHAOS:
-                    game_playlist = "casual_chaos"
-                elif game_playlist_id == GAME_PLAYLIST_RANKED_DUEL:
-                    game_playlist = "ranked_duel"
-                elif game_playlist_id == GAME_PLAYLIST_RANKED_DOUBLE:
-                    game_playlist = "ranked_double"
-                elif game_playlist_id == GAME_PLAYLIST_RANKED_STANDARD:
-                    game_playlist = "ranked_standard"
-                elif game_playlist_id == GAME_PLAYLIST_RANKED_SNOWDAY:
-                    game_playlist = "ranked_snowday"
-                elif game_playlist_id == GAME_PLAYLIST_TOURNAMENT:
-                    game_playlist = "tournament"
-                elif game_playlist_id == GAME_PLAYLIST_CASUAL_GODBAL:
-                    game_playlist = "heatseeker"
-                else:
-                    game_playlist = f"unknown_{game_playlist_id}"
-
-                self.game_playlist = game_playlist
-
-            case "TAGame.VehiclePickup_TA:NewReplicatedPickupData":
-                instigator_id = updated["value"]["pickup_new"]["instigator_id"]
-                if instigator_id is not None:  
-                    if instigator_id != -1:  
-                        if "boost_pickups" not in self.actors[instigator_id]:
-                            self.actors[instigator_id]["boost_pickups"] = []
-                        picked_up = updated["value"]["pickup_new"]["picked_up"]
-                        boost_actor_id = actor["actor_id"]
-                        data = {
-                            "picked_up": picked_up,
-                            "frame_index": self.time,
-                            "boost_actor_id": boost_actor_id,
-                        }
-                        self.actors[instigator_id]["boost_pickups"].append(data)
-
-            case "TAGame.GameEvent_Soccar_TA:MaxScore":
-                self.actors[actor_id]["max_score"] = updated["value"]["int"]
-
-            case "ProjectX.GRI_X:MatchGuid":
-                self.actors[actor_id]["match_guid"] = updated["value"]["string"]
-
-            case "Engine.PlayerReplicationInfo:RemoteUserData":
-                self.actors[actor_id]["remote_user_data"] = updated["value"][
-                    "string"
-                ]
-
-            case "TAGame.CarComponent_Boost_TA:UnlimitedBoostRefCount":
-                self.actors[actor_id]["unlimited_boost_ref_count"] = updated[
-                    "value"
-                ]["int"]
-
-            case "TAGame.VehiclePickup_TA:bNoPickup":
-                self.actors[actor_id]["no_pickup"] = updated["value"]["boolean"]
-
-            case _:
-                # print("unrecognized: ", object_name)
-                pass
+    def parse_object(self, actor, updated):
+        actor_id = actor["actor_id"]["value"]
+        # attribute ids are stable per object within a replay, so after the
+        # first lookup by name a handler is resolved by its numeric id alone
+        handlers = self.actors[actor_id].handlers
+        attribute_id = updated["id"]["value"]
+        handler = handlers.get(attribute_id, UNRESOLVED)
+        if handler is UNRESOLVED:
+            handler = self.attribute_handlers.get(updated["name"])
+            handlers[attribute_id] = handler
+        if handler is not None:
+            handler(self, actor_id, updated["value"])
 
     def dump(self):
 
-        output = ""
+        rows = []
+        kinematics = self.kinematics
         for player, car in self.player_car_pairs:
-            player_name = self.actors[player].get(
-                "player_name", "unknown player"
-            )
-
-            location = self.actors[car].get("location", {"x":None,"y":None,"z":None})
-            rotation = self.actors[car].get("rotation", {"x":None,"y":None,"z":None,"w":None})
-            linear_velocity = self.actors[car].get("linear_velocity", {"x":None,"y":None,"z":None})
-            angular_velocity = self.actors[car].get("angular_velocity", {"x":None,"y":None,"z":None})
-            if angular_velocity is None:
-                angular_velocity = {}
-
-            team = self.actors[car].get("team", -1)
-            boost = self.actors[car].get("boost", 255)  
-
-            x = location.get("x", 0)
-            y = location.get("y", 0)
-            z = location.get("z", 0)
-
-            rx = rotation.get("x", 0)
-            ry = rotation.get("y", 0)
-            rz = rotation.get("z", 0)
-            rw = rotation.get("w", 0)
-
-            lx = linear_velocity.get("x", 0)
-            ly = linear_velocity.get("y", 0)
-            lz = linear_velocity.get("z", 0)
+            player_name = self.actors[player].player_name
+            if player_name is None:
+                player_name = "unknown player"
 
-            ax = angular_velocity.get("x", 0)
-            ay = angular_velocity.get("y", 0)
-            az = angular_velocity.get("z", 0)
+            car = self.actors[car]
+            x, y, z = kinematics.get_location(car.slot)
+            rx, ry, rz, rw = kinematics.get_rotation(car.slot)
+            lx, ly, lz = kinematics.get_linear_velocity(car.slot)
+            ax, ay, az = kinematics.get_angular_velocity(car.slot)
 
-            speed = self.actors[car].get("speed", 0)
-            distance_to_ball = self.actors[car].get("distance_to_ball", 0)
-
-            # print(self.time,player_name, x, y, z, rx, ry, rz, rw, lx, ly, lz, ax, ay, az, speed, distance_to_ball)
             data = [
                 str(self.time),
                 player_name,
-                team,
-                boost,
+                car.team,
+                car.boost,
                 x,
                 y,
                 z,
@@ -409,17 +268,15 @@ class ReplayParse:
                 ax,
                 ay,
                 az,
-                speed,
-                distance_to_ball,
+                car.speed,
+                car.distance_to_ball,
             ]
 
-            output += ",".join(map(str, data)) + "\n"
+            rows.append(",".join(map(str, data)) + "\n")
 
-        ball = self.get_ball()
+        ball = self.ball_id
         if ball is not None:
-            x = self.actors[ball]["location"]["x"]
-            y = self.actors[ball]["location"]["y"]
-            z = self.actors[ball]["location"]["z"]
+            x, y, z = kinematics.get_location(self.actors[ball].slot)
 
             data = [
                 str(self.time),
@@ -432,125 +289,301 @@ class ReplayParse:
                 "", "", "", "", "",
             ]
 
-            output += ",".join(map(str, data)) + "\n"
+            rows.append(",".join(map(str, data)) + "\n")
 
-        return output
+        return "".join(rows)
     
     def calculate(self):
-
-        speed = -1.0
-        if (
-            self.ball_id is not None
-            and "linear_velocity" in self.actors[self.ball_id]
-        ):
-            linear_velocity = self.actors[self.ball_id]["linear_velocity"]
-            if linear_velocity is not None:
-                speed = (
-                    linear_velocity["x"] ** 2
-                    + linear_velocity["y"] ** 2
-                    + linear_velocity["z"] ** 2
-                ) ** 0.5
-                self.actors[self.ball_id]["speed"] = speed
-
-        angle = 0.0
-        if (
-            self.ball_id is not None
-            and "linear_velocity" in self.actors[self.ball_id]
-        ):
-            linear_velocity = self.actors[self.ball_id]["linear_velocity"]
-            if linear_velocity is not None:
-                angle = math.atan2(linear_velocity["y"], linear_velocity["x"])
-                self.actors[self.ball_id]["angle"] = angle
+        """Updates speed and distance to ball of the cars that need it.
+
+        Only cars that moved this frame are recomputed, or all of them when
+        the ball moved or changed; the rest keep their previous values.
+        """
+
+        kinematics = self.kinematics
+        flags = kinematics.flags
+        velocity = kinematics.linear_velocity
+        location = kinematics.location
+        moved = self.moved
+
+        # Timeline.derive() is the vectorized version of this for whole replays
+        ball = None if self.ball_id is None else self.actors[self.ball_id]
+        ball_moved = self.ball_id in moved or self.ball_id != self.calculated_ball_id
+        self.calculated_ball_id = self.ball_id
+        if ball_moved and ball is not None and flags[ball.slot] & LINEAR_VELOCITY:
+            i = 3 * ball.slot
+            vx, vy, vz = velocity[i], velocity[i + 1], velocity[i + 2]
+            ball.speed = (vx ** 2 + vy ** 2 + vz ** 2) ** 0.5
+            ball.angle = math.atan2(vy, vx)
 
         for player, car in self.player_car_pairs:
-            if "linear_velocity" in self.actors[car]:
-                linear_velocity = self.actors[car]["linear_velocity"]
-                if linear_velocity is not None:
-                    speed = (
-                        linear_velocity["x"] ** 2
-                        + linear_velocity["y"] ** 2
-                        + linear_velocity["z"] ** 2
-                    ) ** 0.5
-                    self.actors[car]["speed"] = speed
+            if car not in moved:
+                continue
+            car = self.actors[car]
+            if flags[car.slot] & LINEAR_VELOCITY:
+                i = 3 * car.slot
+                car.speed = (
+                    velocity[i] ** 2
+                    + velocity[i + 1] ** 2
+                    + velocity[i + 2] ** 2
+                ) ** 0.5
             else:
-                self.actors[car]["speed"] = -1.0
-
-        some_big_number = 999999.0
-        if self.ball_id is None:
-            ball_location = {
-                "x": some_big_number,
-                "y": some_big_number,
-                "z": some_big_number,
-            }
+                car.speed = -1.0
+
+        if ball is None or not flags[ball.slot] & LOCATION:
+            ball_x = ball_y = ball_z = math.nan
         else:
-            ball_location = self.actors[self.ball_id]["location"]
+            i = 3 * ball.slot
+            ball_x, ball_y, ball_z = location[i], location[i + 1], location[i + 2]
 
         for player, car in self.player_car_pairs:
-            if "location" in self.actors[car]:
-                car_location = self.actors[car]["location"]
-                car_x, car_y, car_z = (
-                    car_location["x"],
-                    car_location["y"],
-                    car_location["z"],
-                )
-                distance = some_big_number
-                if ball_location is not None and car_location is not None:
-                    distance = (
-                        (ball_location["x"] - car_x) ** 2
-                        + (ball_location["y"] - car_y) ** 2
-                        + (ball_location["z"] - car_z) ** 2
-                    ) ** 0.5
-                self.actors[car]["distance_to_ball"] = distance
+            if not ball_moved and car not in moved:
+                continue
+            car = self.actors[car]
+            if flags[car.slot] & LOCATION:
+                i = 3 * car.slot
+                car.distance_to_ball = (
+                    (ball_x - location[i]) ** 2
+                    + (ball_y - location[i + 1]) ** 2
+                    + (ball_z - location[i + 2]) ** 2
+                ) ** 0.5
 
 
-    def get_player_car_pairs(self):
-        player_car_pairs = []
+    def link_player_car(self, player, car):
+        """Makes car the current car of player; unknown players are ignored."""
+        if player not in self.players:
+            return
+        previous = self.car_players.get(car)
+        if previous is not None and self.players.get(previous) == car:
+            self.players[previous] = None
+        self.car_players[car] = player
+        self.players[player] = car
+        self.moved.add(car)
+
+    def unlink_actor(self, actor_id):
+        """Drops actor_id from the player/car/ball index."""
+        if actor_id == self.ball_id:
+            self.ball_id = None
+            self.ball_destroyed = False
+        car = self.players.pop(actor_id, None)
+        if car is not None:
+            self.car_players.pop(car, None)
+        player = self.car_players.pop(actor_id, None)
+        if player is not None and self.players.get(player) == actor_id:
+            self.players[player] = None
 
-        players = [
-            actor_id
-            for actor_id, actor in self.actors.items()
-            if actor["object_name"] == 'TAGame.Default__PRI_TA'
+    def get_player_car_pairs(self):
+        return [
+            (player, car)
+            for player, car in self.players.items()
+            if car is not None
         ]
 
-        for player in players:
-            car = [
-                actor_id
-                for actor_id, actor in self.actors.items()
-                if player in actor["parent_ids"]
-                and actor["object_name"] == 'Archetypes.Car.Car_Default'
-            ]
-            if len(car) == 0:
-                pass
-            elif len(car) == 1:
-                car = car[0]
-                player_car_pairs.append((player, car))
-            else:
-                car = car[-1]
-                player_car_pairs.append((player, car))
-
-        return player_car_pairs
-
     def get_ball(self):
-
-        ball_types = [
-            'Archetypes.Ball.Ball_Default',
-            'Archetypes.Ball.Ball_Basketball',
-            'Archetypes.Ball.Ball_Hockey',
-            'Archetypes.Ball.Ball_God'
-        ]
-        ball = [
-            actor_id
-            for actor_id, actor in self.actors.items()
-            if actor["object_name"] in ball_types
-        ]
-
-        if len(ball) == 0:
-            return None
-        elif len(ball) == 1:
-            return ball[0]
+        return self.ball_id
+
+
+# attributes of ReplayParse that update() changes, see snapshot()
+SNAPSHOT_STATE = [
+    "time",
+    "current_fps",
+    "actors",
+    "kinematics",
+    "players",
+    "car_players",
+    "player_car_pairs",
+    "ball_id",
+    "ball_destroyed",
+    "calculated_ball_id",
+    "seconds_remaining",
+    "frame_index",
+    "game_playlist",
+    "game_region",
+]
+
+
+def property_value(prop):
+    """Returns the value of a header property, unwrapped for simple kinds."""
+    if prop['kind'] == 'IntProperty':
+        return prop['value']['int']
+    if prop['kind'] == 'StrProperty':
+        return prop['value']['str']
+    if prop['kind'] == 'FloatProperty':
+        return prop['value']['float']
+    if prop['kind'] == 'NameProperty':
+        return prop['value']['name']
+    return prop['value']
+
+
+# formats of the header Date property, newest first
+DATE_FORMATS = ["%Y-%m-%d %H-%M-%S", "%Y-%m-%d:%H-%M"]
+
+
+def parse_date(value):
+    """Returns the header Date property as an ISO datetime, unchanged if unknown."""
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).isoformat()
+        except (TypeError, ValueError):
+            continue
+    return value
+
+
+def end_of_day(value):
+    """Returns an ISO date as the last second of that day, other values unchanged.
+
+    Compared with parse_date() values, an until date then takes in the
+    whole day.
+    """
+    try:
+        return date.fromisoformat(value).isoformat() + "T23:59:59"
+    except (TypeError, ValueError):
+        return value
+
+
+UNRESOLVED = object()
+
+ATTRIBUTE_HANDLERS = {}
+
+
+def register_attribute(name, handler=None):
+    """Registers handler(replay, actor_id, value) for a replicated attribute.
+
+    Can be used as a decorator. Parsers created afterwards pick it up.
+    """
+    if handler is None:
+        return lambda handler: register_attribute(name, handler)
+    ATTRIBUTE_HANDLERS[name] = handler
+    return handler
+
+
+def store_value(field, *path):
+    """Returns a handler that stores value[path[0]][path[1]]... as field."""
+    slotted = field in Actor.__slots__
+
+    def handler(replay, actor_id, value):
+        for key in path:
+            value = value[key]
+        if slotted:
+            setattr(replay.actors[actor_id], field, value)
         else:
-            ball = sorted(
-                ball, key=lambda x: self.actors[x]["created_at_frame"]
-            )
-            # return ball with highest frame number
-            return ball[-1]
+            replay.actors[actor_id].attributes[field] = value
+    return handler
+
+
+def append_parent(replay, actor_id, value):
+    replay.actors[actor_id].parent_ids.append(value["flagged_int"]["int"])
+
+
+def parse_pawn_player(replay, actor_id, value):
+    player = value["flagged_int"]["int"]
+    actor = replay.actors[actor_id]
+    actor.parent_ids.append(player)
+    if actor.object_name == 'Archetypes.Car.Car_Default':
+        replay.link_player_car(player, actor_id)
+
+
+def parse_seconds_remaining(replay, actor_id, value):
+    replay.seconds_remaining = value["int"]
+    replay.actors[actor_id].attributes["seconds_remaining"] = value["int"]
+
+
+def parse_rigid_body_state(replay, actor_id, value):
+    replay.moved.add(actor_id)
+    replay.kinematics.set_rigid_body(
+        replay.actors[actor_id].slot, value["rigid_body_state"]
+    )
+
+
+def parse_team_paint(replay, actor_id, value):
+    actor = replay.actors[actor_id]
+    actor.attributes["team_paint"] = value["team_paint"]
+    actor.team = value["team_paint"]["team"]
+
+
+def parse_server_region(replay, actor_id, value):
+    replay.actors[actor_id].attributes["region"] = value["string"]
+    replay.game_region = value["string"]
+
+
+def parse_game_playlist(replay, actor_id, value):
+    game_playlist_id = value["int"]
+    replay.game_playlist = GAME_PLAYLISTS.get(
+        game_playlist_id, f"unknown_{game_playlist_id}"
+    )
+
+
+def parse_pickup(replay, actor_id, value):
+    instigator_id = value["pickup_new"]["instigator_id"]
+    if instigator_id is not None and instigator_id != -1:
+        instigator = replay.actors.get(instigator_id)
+        if instigator is None:
+            return
+        instigator.attributes.setdefault("boost_pickups", []).append({
+            "picked_up": value["pickup_new"]["picked_up"],
+            "frame_index": replay.time,
+            "boost_actor_id": actor_id,
+        })
+
+
+GAME_PLAYLISTS = {
+    GAME_PLAYLIST_CASUAL_DUEL: "casual_duel",
+    GAME_PLAYLIST_CASUAL_DOUBLE: "casual_double",
+    GAME_PLAYLIST_CASUAL_STANDARD: "casual_standard",
+    GAME_PLAYLIST_CASUAL_CHAOS: "casual_chaos",
+    GAME_PLAYLIST_RANKED_DUEL: "ranked_duel",
+    GAME_PLAYLIST_RANKED_DOUBLE: "ranked_double",
+    GAME_PLAYLIST_RANKED_STANDARD: "ranked_standard",
+    GAME_PLAYLIST_RANKED_SNOWDAY: "ranked_snowday",
+    GAME_PLAYLIST_TOURNAMENT: "tournament",
+    GAME_PLAYLIST_CASUAL_GODBAL: "heatseeker",
+}
+
+ATTRIBUTE_HANDLERS.update({
+    "Engine.Actor:RemoteRole": store_value("remote_role", "enum"),
+    "TAGame.PRI_TA:PersistentCamera": append_parent,
+    "TAGame.CameraSettingsActor_TA:PRI": append_parent,
+    "TAGame.Ball_TA:GameEvent": append_parent,
+    "TAGame.CarComponent_TA:Vehicle": append_parent,
+    "Engine.Pawn:PlayerReplicationInfo": parse_pawn_player,
+    "Engine.PlayerReplicationInfo:Ping": store_value("active", "byte"),
+    "TAGame.CarComponent_Boost_TA:ReplicatedBoost": store_value("boost", "boost", "boostAmount"),
+    "TAGame.PRI_TA:ReplicatedGameEvent": store_value("time_remaining", "flagged_int", "int"),
+    "TAGame.GameEvent_TA:ReplicatedStateName": store_value("stateName", "int"),
+    "TAGame.GameEvent_TA:BotSkill": store_value("bot_skill", "int"),
+    "TAGame.GameEvent_TA:bHasLeaveMatchPenalty": store_value("has_leave_match_penalty", "boolean"),
+    "TAGame.GameEvent_Team_TA:MaxTeamSize": store_value("max_team_size", "int"),
+    "TAGame.GameEvent_Soccar_TA:SecondsRemaining": parse_seconds_remaining,
+    "TAGame.RBActor_TA:ReplicatedRBState": parse_rigid_body_state,
+    "TAGame.Vehicle_TA:ReplicatedSteer": store_value("steer", "byte"),
+    "TAGame.Vehicle_TA:ReplicatedThrottle": store_value("throttle", "byte"),
+    "TAGame.Car_TA:TeamPaint": parse_team_paint,
+    "TAGame.CameraSettingsActor_TA:CameraYaw": store_value("camera_yaw", "byte"),
+    "TAGame.CameraSettingsActor_TA:CameraPitch": store_value("camera_pitch", "byte"),
+    "TAGame.CameraSettingsActor_TA:ProfileSettings": store_value("camera_settings", "cam_settings"),
+    "TAGame.CameraSettingsActor_TA:bUsingSecondaryCamera": store_value("using_ball_cam", "boolean"),
+    "Engine.PlayerReplicationInfo:UniqueId": store_value("unique_id", "unique_id"),
+    "Engine.PlayerReplicationInfo:Team": store_value("team", "flagged_int", "int"),
+    "Engine.PlayerReplicationInfo:PlayerID": store_value("player_id", "int"),
+    "Engine.PlayerReplicationInfo:PlayerName": store_value("player_name", "string"),
+    "TAGame.PRI_TA:CurrentVoiceRoom": store_value("current_voice_room", "string"),
+    "TAGame.PRI_TA:SpectatorShortcut": store_value("spectator_shortcut", "int"),
+    "TAGame.PRI_TA:SteeringSensitivity": store_value("steering_sensitivity", "float"),
+    "TAGame.PRI_TA:Title": store_value("title", "int"),
+    "TAGame.PRI_TA:PartyLeader": store_value("party_leader_id", "party_leader", "id"),
+    "TAGame.PRI_TA:ClientLoadoutsOnline": store_value("loadout_online", "loadouts_online"),
+    "TAGame.PRI_TA:ClientLoadouts": store_value("team_loadout", "loadouts"),
+    "TAGame.PRI_TA:PlayerHistoryValid": store_value("player_history_valid", "boolean"),
+    "TAGame.GameEvent_Soccar_TA:MaxScore": store_value("score", "int"),
+    "Engine.GameReplicationInfo:ServerName": store_value("server", "string"),
+    "ProjectX.GRI_X:MatchGuid": store_value("match_guid", "string"),
+    "ProjectX.GRI_X:bGameStarted": store_value("game_started", "boolean"),
+    "ProjectX.GRI_X:GameServerID": store_value("server_id", "game_server", "new"),
+    "ProjectX.GRI_X:Reservations": store_value("reservation", "reservation"),
+    "ProjectX.GRI_X:ReplicatedServerRegion": parse_server_region,
+    "ProjectX.GRI_X:ReplicatedGamePlaylist": parse_game_playlist,
+    "TAGame.VehiclePickup_TA:NewReplicatedPickupData": parse_pickup,
+    "Engine.PlayerReplicationInfo:RemoteUserData": store_value("remote_user_data", "string"),
+    "TAGame.CarComponent_Boost_TA:UnlimitedBoostRefCount": store_value("unlimited_boost_ref_count", "int"),
+    "TAGame.VehiclePickup_TA:bNoPickup": store_value("no_pickup", "boolean"),
+})
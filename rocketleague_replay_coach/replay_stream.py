@@ -0,0 +1,294 @@
+import json
+import os
+import subprocess
+import tempfile
+
+DECODER = json.JSONDecoder()
+WHITESPACE = " \t\n\r"
+# bytes at the end of a json searched for its header
+HEADER_TAIL_SIZE = 1 << 20
+
+
+def read_replay_header(replay_path, rattletrap="rattletrap"):
+    """Returns the header of a .replay, decoded by rattletrap without the frames."""
+    # --fast stops rattletrap after the header
+    process = subprocess.run(
+        [rattletrap, "-i", replay_path, "-c", "--fast"],
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+    )
+    if process.returncode != 0:
+        raise ValueError(f'rattletrap failed on "{replay_path}": {process.stderr.strip()}')
+    return json.loads(process.stdout)["header"]
+
+
+def read_json_header(replay_path):
+    """Returns the header of a rattletrap json without decoding its frames.
+
+    rattletrap sorts keys, so the header is the last member of the top
+    level and is decoded from the end of the file. Otherwise the json is
+    streamed, which stops at the frames when the header comes first.
+    """
+    with open(replay_path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(size - HEADER_TAIL_SIZE, 0))
+        tail = f.read().decode("utf-8", errors="replace")
+    end = len(tail)
+    while True:
+        end = tail.rfind('"header"', 0, end)
+        if end < 0:
+            break
+        pos = end + len('"header"')
+        while pos < len(tail) and tail[pos] in WHITESPACE:
+            pos += 1
+        if not tail.startswith(":", pos):
+            continue
+        pos += 1
+        while pos < len(tail) and tail[pos] in WHITESPACE:
+            pos += 1
+        try:
+            header, pos = DECODER.raw_decode(tail, pos)
+        except ValueError:
+            continue
+        if tail[pos:].strip(WHITESPACE) == "}":
+            return header
+    with ReplayStream(open(replay_path, mode="r", encoding="utf-8")) as stream:
+        return stream.header
+
+
+class ReplayStream:
+    """Incremental reader for the JSON rattletrap writes.
+
+    Values around content.body.frames (the header, key_frames, ...) are
+    decoded as they are met, frames() yields one frame at a time, so memory
+    depends on the size of a frame, not of the replay. rattletrap sorts
+    keys, which puts the header after the frames: then the frames are
+    skipped one at a time to reach it and the file is read again from the
+    start, unless the header was given.
+    """
+
+    def __init__(self, file, chunk_size=1 << 16, header=None):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.process = None
+        self.stderr = None
+        self.replay_path = None
+        self.header = header
+        self.content = {}
+        self.frames_read = False
+        try:
+            self.find_frames()
+        except Exception:
+            self.file.close()
+            raise
+
+    @classmethod
+    def open_replay(cls, replay_path, rattletrap="rattletrap"):
+        """Streams the JSON rattletrap decodes from replay_path on its stdout.
+
+        A pipe cannot be read twice, so the header is read first by a
+        separate rattletrap --fast.
+        """
+        header = read_replay_header(replay_path, rattletrap)
+        # a file, not a pipe, so rattletrap never blocks on a full stderr
+        stderr = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+        process = subprocess.Popen(
+            [rattletrap, "-i", replay_path, "-c"],
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            text=True,
+            encoding="utf-8",
+        )
+        try:
+            stream = cls(process.stdout, header=header)
+        except ValueError as e:
+            process.kill()
+            process.wait()
+            stderr.seek(0)
+            message = stderr.read().strip()
+            stderr.close()
+            raise ValueError(f'rattletrap failed on "{replay_path}": {message}') from e
+        stream.process = process
+        stream.stderr = stderr
+        stream.replay_path = replay_path
+        return stream
+
+    def frames(self):
+        if self.frames_read:
+            raise ValueError("frames of a replay stream can only be read once")
+        self.frames_read = True
+
+        try:
+            yield from self.elements()
+        except ValueError:
+            # truncated json from a rattletrap that failed says less than its stderr
+            self.check_process()
+            raise
+        if self.process is not None:
+            # let rattletrap write the rest, then see how it exited
+            while self.file.read(self.chunk_size):
+                pass
+            self.eof = True
+            self.check_process()
+
+    def check_process(self):
+        """Raises the error of a rattletrap that exited unsuccessfully."""
+        if self.process is None:
+            return
+        if self.eof:
+            self.process.wait()
+        if self.process.poll() not in (None, 0):
+            self.stderr.seek(0)
+            message = self.stderr.read().strip() or f"rattletrap exited with {self.process.returncode}"
+            raise ValueError(f'rattletrap failed on "{self.replay_path}": {message}')
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+        self.file.close()
+        if self.process is not None:
+            self.process.wait()
+        if self.stderr is not None:
+            self.stderr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def find_frames(self):
+        found = self.scan()
+        if found == "stopped":
+            return
+        if found is None:
+            raise ValueError("replay json has no content.body.frames")
+        if self.header is None:
+            raise ValueError("replay json has no header")
+        if not self.file.seekable():
+            raise ValueError("replay json has its header after the frames and cannot be read again")
+        self.file.seek(0)
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.scan()
+
+    def scan(self):
+        """Reads the top level up to content.body.frames.
+
+        Returns "stopped" at the frames once the header is known. Without
+        the header the frames are skipped and the rest of the json is read,
+        then it returns "skipped", or None if there were no frames.
+        """
+        found = None
+        for key in self.members():
+            if key == "header" and self.header is None:
+                self.header = self.decode_value()
+            elif key == "content":
+                for key in self.members():
+                    if key != "body":
+                        self.skip_value()
+                        continue
+                    for key in self.members():
+                        if key != "frames":
+                            self.content[key] = self.decode_value()
+                        elif self.header is not None:
+                            return "stopped"
+                        else:
+                            self.skip_value()
+                            found = "skipped"
+            else:
+                self.skip_value()
+        return found
+
+    def elements(self):
+        """Yields the values of the array at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode_value()
+            c = self.next_char()
+            if c == "]":
+                return
+            if c != ",":
+                raise ValueError(f"unexpected {c!r} between array elements")
+
+    def skip_value(self):
+        """Reads past the value at the current position, an array one element at a time."""
+        if self.peek() == "[":
+            for _ in self.elements():
+                pass
+        else:
+            self.decode_value()
+
+    def members(self):
+        """Yields the keys of the object at the current position.
+
+        The caller has to consume the value of each key before the next one.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.decode_value()
+            self.expect(":")
+            yield key
+            c = self.next_char()
+            if c == "}":
+                return
+            if c != ",":
+                raise ValueError(f"unexpected {c!r} between object members")
+
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.fill()
+                continue
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and not self.eof:
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+    def expect(self, expected):
+        c = self.next_char()
+        if c != expected:
+            raise ValueError(f"expected {expected!r} in replay json, found {c!r}")
+
+    def next_char(self):
+        c = self.peek()
+        self.pos += 1
+        return c
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                raise ValueError("unexpected end of replay json")
+            self.fill()
+
+    def fill(self):
+        # read at least as much as is pending, so a large value is retried
+        # a logarithmic number of times
+        pending = self.buffer[self.pos:]
+        chunk = self.file.read(max(self.chunk_size, len(pending)))
+        if not chunk:
+            self.eof = True
+        self.buffer = pending + chunk
+        self.pos = 0
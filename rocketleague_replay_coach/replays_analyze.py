@@ -1,38 +1,58 @@
-import openai
 import pandas as pd
 import os
-from openai import OpenAI
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # or 'Agg' for headless mode
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+from llm_cache import ResponseCache
+from llm_scheduler import LLMScheduler
+from downsample import adaptive_sample
+from prompt_builder import build_prompt
+from session_summary import SessionSummary
+from timeline import load_frame
 
 player_the_name = os.getenv("PLAYER_NAME")
 
-# Initialize OpenAI client
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),  # This is the default and can be omitted
-)
-intervalx = 1000
-
-def read_csv(file_path, time_interval=25600):
-    """Reads the CSV file and returns a time-based filtered sample."""
-    df = pd.read_csv(file_path)
-    
-    # Sample rows based on a time interval
-    df['time'] = df['time'] * 10000000  # if time is in seconds, convert to microseconds
-    df['time'] = df['time'].astype(int)
-
-    # Filter by specific time intervals
-    filtered_df = df[df['time'] % time_interval == 0]
-
-    return filtered_df.to_csv(index=False)
-
-def format_data_for_prompt(filename,data_csv):
+# plots show a sample every this many seconds in quiet play, more around action
+plot_quiet_interval = 0.25
+
+def make_scheduler():
+    """Returns the LLMScheduler that sends the gpt-4o requests, several at a time with retries."""
+    # Responses already received for the same prompt are reused; an empty
+    # RL_LLM_CACHE_DIR turns this off
+    llm_cache_dir = os.getenv("RL_LLM_CACHE_DIR", os.path.join(os.getcwd(), 'llm_cache'))
+    llm_cache = None
+    if llm_cache_dir:
+        llm_cache = ResponseCache(
+            llm_cache_dir,
+            ttl=float(os.getenv("RL_LLM_CACHE_TTL_DAYS", 30)) * 24 * 3600,
+            max_bytes=int(os.getenv("RL_LLM_CACHE_MAX_MB", 256)) << 20,
+        )
+    return LLMScheduler(model="gpt-4o", cache=llm_cache)
+
+def make_session(scheduler):
+    """Returns the SessionSummary of this folder, sending its requests through scheduler."""
+    # Condensed feedback of each match and the merges of the session summary
+    # are kept here between runs; an empty RL_SESSION_STATE keeps them in memory
+    return SessionSummary(
+        os.getenv("RL_SESSION_STATE", os.path.join(os.getcwd(), 'session_state.json')),
+        scheduler,
+        batch_size=int(os.getenv("RL_SUMMARY_BATCH", 8)),
+    )
+
+def load_match(csv_path):
+    """Loads a match once, from its typed .npz when replays_csv.py wrote one."""
+    npz_path = os.path.splitext(csv_path)[0] + ".npz"
+    if os.path.exists(npz_path) and os.path.getmtime(npz_path) >= os.path.getmtime(csv_path):
+        return load_frame(npz_path)
+    return pd.read_csv(csv_path)
+
+def format_data_for_prompt(filename,match,token_budget=None):
     """
-    Formats the relevant player information from the CSV into a structured format
-    that can be sent to the GPT API for coaching feedback.
+    Formats the relevant player information of a loaded match into a compact
+    structure, within token_budget, that can be sent to the GPT API for
+    coaching feedback.
     """
     base_name, _ = os.path.splitext(filename)
 
@@ -40,68 +60,49 @@ def format_data_for_prompt(filename,data_csv):
     parts = base_name.split('_')
 
     if parts[1] == 'heatseeker':
-        prompt = f"""
-        The following represents a heatseeker replay of Rocket League.  Everyone has full boost always, and the ball follows a heatseeking trajectory towards goal. It includes the players and the ball locations for a subset of timestamps during the match. (Note: every {intervalx}th timestamp has been filtered)
+        intro = f"""
+        The following represents a heatseeker replay of Rocket League.  Everyone has full boost always, and the ball follows a heatseeking trajectory towards goal. It includes a summary of each player, notable events, and the players and the ball locations sampled during the match, more often around hits and the ball.
         Kindly analyze the match and provide heatseaker coaching feedback for {player_the_name}.
-
-        {data_csv}
         """
-        return prompt
-
-    prompt = f"""
-    The following represents a match replay of Rocket League. It includes the players and the ball locations for a subset of timestamps during the match. (Note: every {intervalx}th timestamp has been filtered)
+    else:
+        intro = f"""
+    The following represents a match replay of Rocket League. It includes a summary of each player, notable events, and the players and the ball locations sampled during the match, more often around hits and the ball.
     Kindly analyze the match and provide coaching feedback for {player_the_name}.
-
-    {data_csv}
     """
+
+    # tokens a match prompt may use, the sample rate is chosen to fit
+    token_budget = token_budget or int(os.getenv("RL_PROMPT_TOKENS", 8000))
+    prompt, tokens = build_prompt(intro, match, token_budget)
+    print(f"Prompt for {filename}: ~{tokens} tokens (budget {token_budget})")
     return prompt
 
 
 
-def get_coaching_feedback(prompt):
-    """Sends a prompt to the GPT-4 API and returns the feedback."""
-    try:
-        stream = client.chat.completions.create(
-            messages=[{
-                "role": "user",
-                "content": prompt,
-            }],
-            model="gpt-4o",
-            stream=True,
-        )
-        feedback = ''
-        for chunk in stream:
-            feedback += chunk.choices[0].delta.content or ""
-        return feedback
-    except Exception as e:
-        print(f"Error while fetching feedback: {e}")
-        return None
+def get_coaching_feedback(prompt, scheduler):
+    """Sends a prompt to the GPT-4 API and returns the feedback, None on failure."""
+    return scheduler.complete_all([prompt])[0]
 
-def generate_session_summary(all_feedback):
-    """Generates an overview summary of the session's feedback using GPT-4."""
-    try:
-        # Combine all feedback from all matches into one single string
-        prompt = f"Please provide a session-wide summary of the following coaching feedback for Rocket League matches:\n\n{all_feedback}"
-
-        stream = client.chat.completions.create(
-            messages=[{
-                "role": "user",
-                "content": prompt,
-            }],
-            model="gpt-4o",
-            stream=True,
-        )
-        summary = ''
-        for chunk in stream:
-            summary += chunk.choices[0].delta.content or ""
-        return summary
-    except Exception as e:
-        print(f"Error while generating session summary: {e}")
-        return None
+def generate_session_summary(session, feedback, matches=None):
+    """Generates an overview summary of the session's feedback using GPT-4.
+
+    feedback maps match names to their new feedback; only feedback not seen
+    before is condensed. The summary covers the named matches, by default
+    every match condensed so far.
+    """
+    session.condense(feedback)
+    return session.summarize(matches)
+
+def save_session_summary(session_summary, all_feedback=""):
+    """Writes session_summary.md, followed by the full feedback of this run."""
+    session_summary_path = "session_summary.md"
+    with open(session_summary_path, 'w') as summary_file:
+        summary_file.write(f"# Session Summary\n\n{session_summary}\n\n{all_feedback}")
+    print(f"Session summary saved to {session_summary_path}")
 
-def plot_regular(filename):
+def plot_regular(filename, data=None):
     # Read the match data from CSV
-    data = pd.read_csv("csv/" + filename)
+    if data is None:
+        data = load_match("csv/" + filename)
 
     # Create a 3D plot
     fig = plt.figure(figsize=(10, 8))
@@ -222,9 +223,10 @@ def plot_regular(filename):
     return [output_filename1, output_filename2]
 
 
-def plot_heatseeker(filename):
+def plot_heatseeker(filename, data=None):
     # Read the match data from CSV
-    data = pd.read_csv("csv/" + filename)
+    if data is None:
+        data = load_match("csv/" + filename)
 
     # Create a 3D plot
     fig = plt.figure(figsize=(10, 8))
@@ -326,16 +328,52 @@ def plot_heatseeker(filename):
     return [output_filename1, output_filename2]
 
 
-def plot_rocket_league_match(filename):
+def plot_rocket_league_match(filename, data=None):
 
     base_name, _ = os.path.splitext(filename)
     # Split the filename by underscores
     parts = base_name.split('_')
 
     if parts[1] == 'heatseeker':
-        return plot_heatseeker(filename)
+        return plot_heatseeker(filename, data)
 
-    return plot_regular(filename)
+    return plot_regular(filename, data)
+
+
+def prepare_match(csv_path):
+    """Plots one match and returns the markdown of its images and its prompt."""
+    csv_file = os.path.basename(csv_path)
+
+    # Load the match once and share it between the prompt and the plots
+    match = load_match(csv_path)
+    prompt = format_data_for_prompt(csv_file,match)
+    images = plot_rocket_league_match(csv_file, adaptive_sample(match, plot_quiet_interval, 1 / 30))
+    images_md = "\n\n".join([f"![img]({image})" for image in images])
+    return images_md, prompt
+
+def save_feedback(csv_file, images_md, coaching, output_dir):
+    """Writes the feedback .md of a match and returns the feedback, None without coaching."""
+    if not coaching:
+        return None
+
+    # Constructing the feedback string including the markdown and coaching feedback
+    feedback = f"{images_md}\n\n{coaching}"
+
+    # Save the feedback as a .md file in the output directory
+    md_file_path = os.path.join(output_dir, f"{os.path.splitext(csv_file)[0]}.md")
+    with open(md_file_path, 'w') as md_file:
+        md_file.write(f"# Feedback for {csv_file}\n\n{feedback}")
+    print(f"Feedback saved to {md_file_path}\n")
+    return feedback
+
+def analyze_match(csv_path, output_dir, scheduler):
+    """Plots one match and asks for coaching feedback, saved as a .md in output_dir.
+
+    Returns the feedback, or None when none was received.
+    """
+    images_md, prompt = prepare_match(csv_path)
+    print(f"Sending prompt to ChatGPT for {os.path.basename(csv_path)}")
+    return save_feedback(os.path.basename(csv_path), images_md, get_coaching_feedback(prompt, scheduler), output_dir)
 
 
 def main():
@@ -347,51 +385,51 @@ def main():
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
+    scheduler = make_scheduler()
+    session = make_session(scheduler)
+
     all_feedback = ""  # Variable to accumulate feedback from all matches
+    feedback_by_file = {}
     
-    # Loop through all .csv files in the input directory
-    for csv_file in os.listdir(input_dir):
+    # Plot every match and build its prompt first, then request all the
+    # feedback concurrently
+    matches = []
+    for csv_file in sorted(os.listdir(input_dir)):
         if csv_file.endswith('.csv'):  # Only process .csv files
             csv_path = os.path.join(input_dir, csv_file)
             
             try:
-                # Read the CSV and format the data for the prompt
-                data = read_csv(csv_path)
-                prompt = format_data_for_prompt(csv_file,data)
-                images = plot_rocket_league_match(csv_file)
-                images_md = "\n\n".join([f"![img]({image})" for image in images])
-
-                print(f"Sending prompt to ChatGPT for {csv_file}")
-
-                # Constructing the feedback string including the markdown and coaching feedback
-                feedback = f"{images_md}\n\n" + get_coaching_feedback(prompt)
-                
-                if feedback:
-                    print(f"Coaching Feedback for {csv_file}: \n{feedback}\n")
-                    
-                    # Append feedback to the accumulated all_feedback string
-                    all_feedback += f"## Feedback for {csv_file}\n\n{feedback}\n\n"
-                    
-                    # Save the feedback as a .md file in the output directory
-                    md_file_path = os.path.join(output_dir, f"{os.path.splitext(csv_file)[0]}.md")
-                    with open(md_file_path, 'w') as md_file:
-                        md_file.write(f"# Feedback for {csv_file}\n\n{feedback}")
-                    print(f"Feedback saved to {md_file_path}\n")
-                else:
-                    print(f"No feedback received for {csv_file}.\n")
-            
+                images_md, prompt = prepare_match(csv_path)
+                matches.append((csv_file, images_md, prompt))
             except Exception as e:
                 print(f"Error processing {csv_file}: {str(e)}")
 
-    # After generating all coaching feedback files, generate the session-wide summary
-    session_summary = generate_session_summary(all_feedback)
+    print(f"Sending {len(matches)} prompts to ChatGPT, {scheduler.concurrency} at a time")
+    coachings = scheduler.complete_all([prompt for _, _, prompt in matches])
+
+    for (csv_file, images_md, _), coaching in zip(matches, coachings):
+        try:
+            feedback = save_feedback(csv_file, images_md, coaching, output_dir)
+
+            if feedback:
+                print(f"Coaching Feedback for {csv_file}: \n{feedback}\n")
+
+                # Append feedback to the accumulated all_feedback string
+                all_feedback += f"## Feedback for {csv_file}\n\n{feedback}\n\n"
+                feedback_by_file[csv_file] = feedback
+            else:
+                print(f"No feedback received for {csv_file}.\n")
+
+        except Exception as e:
+            print(f"Error processing {csv_file}: {str(e)}")
+
+    # After generating all coaching feedback files, generate the session-wide
+    # summary; matches condensed in earlier runs are not sent again
+    session_summary = generate_session_summary(session, feedback_by_file, [csv_file for csv_file, _, _ in matches])
     
     if session_summary:
         # Write the session summary to a dedicated file
-        session_summary_path = "session_summary.md"
-        with open(session_summary_path, 'w') as summary_file:
-            summary_file.write(f"# Session Summary\n\n{session_summary}\n\n{all_feedback}")
-        print(f"Session summary saved to {session_summary_path}")
+        save_session_summary(session_summary, all_feedback)
     else:
         print("Failed to generate session summary.")
 
@@ -0,0 +1,166 @@
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from replay_parse import ReplayParse, end_of_day, parse_date
+from replay_stream import read_json_header, read_replay_header
+
+RATTLETRAP = os.getenv("RATTLETRAP", "rattletrap")
+
+
+def read_header(replay_path):
+    """Returns the header of a .replay or a rattletrap json without its frames."""
+    if replay_path.lower().endswith(".replay"):
+        return read_replay_header(replay_path, RATTLETRAP)
+    return read_json_header(replay_path)
+
+
+def catalog_entry(header):
+    """Returns the catalog fields of a replay header."""
+    game = ReplayParse({"header": header})
+    return {
+        "id": game.find_property("Id"),
+        "map_name": game.map_name,
+        "match_type": game.find_property("MatchType"),
+        "team_size": game.find_property("TeamSize"),
+        "date": parse_date(game.find_property("Date")),
+        "num_frames": game.find_property("NumFrames"),
+        "team0_score": game.find_property("Team0Score") or 0,
+        "team1_score": game.find_property("Team1Score") or 0,
+        "goals": [
+            {
+                "frame": goal.get("frame"),
+                "player_name": goal.get("PlayerName"),
+                "team": goal.get("PlayerTeam"),
+            }
+            for goal in game.find_array_property("Goals")
+        ],
+        "players": [
+            {
+                "name": stats.get("Name"),
+                "team": stats.get("Team"),
+                "score": stats.get("Score"),
+                "goals": stats.get("Goals"),
+                "assists": stats.get("Assists"),
+                "saves": stats.get("Saves"),
+                "shots": stats.get("Shots"),
+            }
+            for stats in game.find_array_property("PlayerStats")
+        ],
+    }
+
+
+class ReplayCatalog:
+    """Header metadata of many replays in a json lines index file.
+
+    Entries are keyed by replay path and refreshed only when the file's
+    size or mtime changed, so updating a large folder reads just the new
+    headers. Frames are not decoded, so the playlist and region, which
+    live in the frames, are unknown; filter on team_size and match_type
+    instead.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["replay"]] = entry
+
+    def update(self, replay_paths, workers=None):
+        """Reads the headers of new or changed replays, returns (added, failed)."""
+        stale = []
+        for replay_path in replay_paths:
+            stat = os.stat(replay_path)
+            entry = self.entries.get(replay_path)
+            if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+                stale.append((replay_path, stat))
+
+        def read(item):
+            replay_path, stat = item
+            try:
+                entry = catalog_entry(read_header(replay_path))
+            except Exception as e:
+                return replay_path, None, str(e)
+            entry.update(replay=replay_path, size=stat.st_size, mtime=stat.st_mtime)
+            return replay_path, entry, None
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            for replay_path, entry, error in executor.map(read, stale):
+                if error is None:
+                    self.entries[replay_path] = entry
+                else:
+                    failed.append((replay_path, error))
+
+        # replays deleted since the last update
+        for replay_path in set(self.entries) - set(replay_paths):
+            del self.entries[replay_path]
+        return len(stale) - len(failed), failed
+
+    def save(self):
+        partial_path = self.path + ".partial"
+        with open(partial_path, "w", encoding="utf-8") as f:
+            for replay_path in sorted(self.entries):
+                f.write(json.dumps(self.entries[replay_path]) + "\n")
+        os.replace(partial_path, self.path)
+
+    def select(self, map_name=None, match_type=None, team_size=None, player=None, since=None, until=None):
+        """Returns the entries matching every given filter, newest first.
+
+        since and until are ISO dates or datetimes, inclusive; an until date
+        takes in the whole day.
+        """
+        selected = []
+        for entry in self.entries.values():
+            if map_name is not None and entry["map_name"] != map_name:
+                continue
+            if match_type is not None and entry["match_type"] != match_type:
+                continue
+            if team_size is not None and entry["team_size"] != team_size:
+                continue
+            if player is not None and player not in [p["name"] for p in entry["players"]]:
+                continue
+            date = entry["date"] or ""
+            if since is not None and date < since:
+                continue
+            if until is not None and date > end_of_day(until):
+                continue
+            selected.append(entry)
+        return sorted(selected, key=lambda entry: entry["date"] or "", reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog replay headers and filter them.")
+    parser.add_argument("--catalog", default=os.path.join(os.getcwd(), "catalog.jsonl"))
+    parser.add_argument("--map", dest="map_name")
+    parser.add_argument("--match-type")
+    parser.add_argument("--team-size", type=int)
+    parser.add_argument("--player")
+    parser.add_argument("--since", help="ISO date, e.g. 2024-11-18")
+    parser.add_argument("--until", help="ISO date, e.g. 2024-11-25")
+    args = parser.parse_args()
+
+    replay_dir = os.getenv("RL_REPLAY_DIR", os.getcwd())
+    workers = int(os.getenv("RL_WORKERS", 0)) or None
+    replay_paths = sorted(glob.glob(os.path.join(replay_dir, "*.replay")))
+
+    catalog = ReplayCatalog(args.catalog)
+    added, failed = catalog.update(replay_paths, workers)
+    catalog.save()
+    print(f"Catalog {args.catalog}: {len(catalog.entries)} replays, {added} read, {len(failed)} failed")
+    for replay_path, error in failed:
+        print(f"Error reading {replay_path}: {error}")
+
+    for entry in catalog.select(args.map_name, args.match_type, args.team_size, args.player, args.since, args.until):
+        print(f"{entry['date']}  {entry['map_name']}  {entry['team_size']}v{entry['team_size']}  "
+              f"{entry['team0_score']}-{entry['team1_score']}  {entry['replay']}")
+
+
+if __name__ == "__main__":
+    main()
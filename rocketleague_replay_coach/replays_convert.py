@@ -0,0 +1,108 @@
+import glob
+import hashlib
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+RATTLETRAP = os.getenv("RATTLETRAP", "rattletrap")
+
+
+def file_hash(path):
+    """Returns the sha256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def json_path_for(replay_path, json_dir):
+    return os.path.join(json_dir, os.path.basename(replay_path) + ".json")
+
+
+def is_fresh(replay_path, json_path, source_hash):
+    """True when json_path is newer than the replay and was made from the same bytes."""
+    hash_path = json_path + ".sha256"
+    if not os.path.exists(json_path) or not os.path.exists(hash_path):
+        return False
+    if os.path.getmtime(json_path) < os.path.getmtime(replay_path):
+        return False
+    with open(hash_path, "r") as f:
+        return f.read().strip() == source_hash
+
+
+def convert_replay(replay_path, json_dir):
+    """Converts one replay to json with rattletrap unless it is up to date."""
+    start = time.perf_counter()
+    json_path = json_path_for(replay_path, json_dir)
+    result = {"replay": replay_path, "json": json_path, "status": "converted", "error": None}
+
+    try:
+        source_hash = file_hash(replay_path)
+        if is_fresh(replay_path, json_path, source_hash):
+            result["status"] = "skipped"
+        else:
+            # write next to the target and rename, so a json file is never half written
+            partial_path = json_path + ".partial"
+            process = subprocess.run(
+                [RATTLETRAP, "-i", replay_path, "-c", "-o", partial_path],
+                capture_output=True,
+                text=True,
+            )
+            if process.returncode != 0:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise RuntimeError(process.stderr.strip() or f"rattletrap exited with {process.returncode}")
+            os.replace(partial_path, json_path)
+            with open(json_path + ".sha256", "w") as f:
+                f.write(source_hash)
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def convert_replays(replay_paths, json_dir, workers=None):
+    """Converts replays on a pool of rattletrap processes, yielding results as they finish."""
+    workers = workers or os.cpu_count() or 1
+    # threads are enough, the work happens in the rattletrap subprocesses
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(convert_replay, path, json_dir) for path in replay_paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main():
+    replay_dir = os.getenv("RL_REPLAY_DIR", os.getcwd())
+    json_dir = os.path.join(os.getcwd(), "json")
+    workers = int(os.getenv("RL_WORKERS", 0)) or None
+
+    os.makedirs(json_dir, exist_ok=True)
+
+    replay_paths = sorted(glob.glob(os.path.join(replay_dir, "*.replay")))
+    if not replay_paths:
+        print(f"No .replay files found in {replay_dir}.")
+        return
+
+    counts = {"converted": 0, "skipped": 0, "failed": 0}
+    start = time.perf_counter()
+    for result in convert_replays(replay_paths, json_dir, workers):
+        counts[result["status"]] += 1
+        if result["status"] == "converted":
+            print(f"Processed {result['replay']} in {result['seconds']:.2f}s")
+        elif result["status"] == "skipped":
+            print(f"Skipped {result['replay']}, json is up to date")
+        else:
+            print(f"Error processing {result['replay']}: {result['error']}")
+
+    print(
+        f"Converted {counts['converted']}, skipped {counts['skipped']}, "
+        f"failed {counts['failed']} replays in {time.perf_counter() - start:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,146 @@
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from parse_cache import ParseCache
 from rattleplayer import RattlePlayer
+from stats_store import StatsStore, match_record
+from timeline import Timeline
+
+
+def parse_replay(replay_path, csv_output_dir, cache=None):
+    """Parses one replay json, writing its csv and .npz to csv_output_dir.
+
+    With a ParseCache, a replay parsed before by the same parser is copied
+    out of the cache instead.
+    """
+    start = time.perf_counter()
+    replay_file = os.path.basename(replay_path)
+    result = {"replay": replay_file, "csv": None, "error": None, "cached": False, "stats": None}
+
+    # playlist and region are only known once all frames are parsed, so
+    # rows go to a partial file that is renamed at the end
+    partial_path = os.path.join(csv_output_dir, f"{os.path.splitext(replay_file)[0]}.csv.partial")
+
+    try:
+
+        if cache is not None:
+            key = cache.key(replay_path)
+            meta = cache.get(key)
+            if meta is not None:
+                csv_file_path = os.path.join(csv_output_dir, meta["csv"])
+                cache.restore(key, meta["csv"], csv_file_path)
+                cache.restore(key, meta["npz"], os.path.splitext(csv_file_path)[0] + ".npz")
+                result["csv"] = csv_file_path
+                result["stats"] = meta.get("stats")
+                result["cached"] = True
+                result["seconds"] = time.perf_counter() - start
+                return result
+
+        with RattlePlayer(replay_path, stream=True) as rattleplayer:
+            timeline = Timeline(rattleplayer.game.num_frames)
+            with open(partial_path, 'w') as csv_file:
+                rattleplayer.generate_csv(csv_file, timeline)
+        csv_file_path = os.path.join(csv_output_dir, f"{os.path.splitext(replay_file)[0]}_{rattleplayer.game.game_playlist}_{rattleplayer.game.game_region}.csv")
+        os.replace(partial_path, csv_file_path)
+        # typed copy of the csv for replays_analyze.py, see load_frame()
+        npz_file_path = os.path.splitext(csv_file_path)[0] + ".npz"
+        timeline.save(npz_file_path)
+        result["csv"] = csv_file_path
+        result["stats"] = match_record(replay_file, rattleplayer.game, timeline)
+
+        if cache is not None:
+            cache.put(key, {
+                "csv": os.path.basename(csv_file_path),
+                "npz": os.path.basename(npz_file_path),
+                "game_playlist": rattleplayer.game.game_playlist,
+                "game_region": rattleplayer.game.game_region,
+                "num_frames": timeline.num_frames,
+                "stats": result["stats"],
+            }, [csv_file_path, npz_file_path])
+
+    except Exception as e:
+        result["error"] = str(e)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def parse_replays(replay_paths, csv_output_dir, workers=None, cache=None):
+    """Parses replays on a pool of worker processes, yielding results as they finish.
+
+    ReplayParse is pure Python, so each replay gets a process of its own.
+    With a single worker everything runs in this process.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for replay_path in replay_paths:
+            yield parse_replay(replay_path, csv_output_dir, cache)
+        return
+
+    # largest first, so a long replay does not start last and hold up the batch
+    replay_paths = sorted(replay_paths, key=os.path.getsize, reverse=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(parse_replay, path, csv_output_dir, cache) for path in replay_paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main():
+    # Path to the directory containing replay files
+    replay_dir = os.path.join(os.getcwd(), 'json')
+    csv_output_dir = os.path.join(os.getcwd(), 'csv')
+    workers = int(os.getenv("RL_WORKERS", 0)) or None
+    # an empty RL_CACHE_DIR turns the parse cache off
+    cache_dir = os.getenv("RL_CACHE_DIR", os.path.join(os.getcwd(), 'cache'))
+    cache_max_mb = int(os.getenv("RL_CACHE_MAX_MB", 2048))
+    # an empty RL_STATS_DB turns the stats store off
+    stats_db = os.getenv("RL_STATS_DB", os.path.join(os.getcwd(), 'stats.db'))
+    stats_timelines = os.getenv("RL_STATS_TIMELINES", "0") == "1"
+
+    if not os.path.exists(csv_output_dir):
+        os.makedirs(csv_output_dir)
 
-# Path to the directory containing replay files
-replay_dir = os.path.join(os.getcwd(), 'json')
-csv_output_dir = os.path.join(os.getcwd(), 'csv')
+    cache = ParseCache(cache_dir, cache_max_mb << 20) if cache_dir else None
 
-if not os.path.exists(csv_output_dir):
-    os.makedirs(csv_output_dir)
+    replay_paths = [
+        os.path.join(replay_dir, replay_file)
+        for replay_file in os.listdir(replay_dir)
+        if replay_file.endswith(".json")
+    ]
 
-for replay_file in os.listdir(replay_dir):
-    if replay_file.endswith(".json"):  
-        replay_path = os.path.join(replay_dir, replay_file)
-        
-        try:
+    parsed, cached, failed, records = 0, 0, [], []
+    start = time.perf_counter()
+    for result in parse_replays(replay_paths, csv_output_dir, workers, cache):
+        if result["error"] is None:
+            parsed += 1
+            if result["stats"] is not None:
+                records.append(result["stats"])
+            if result["cached"]:
+                cached += 1
+                print(f"CSV for {result['replay']} restored from cache to {result['csv']}")
+            else:
+                print(f"CSV for {result['replay']} written to {result['csv']} in {result['seconds']:.2f}s")
+        else:
+            failed.append(result)
+            print(f"Error parsing {result['replay']}: {result['error']}")
 
-            rattleplayer = RattlePlayer(replay_path)
-            csv_data = rattleplayer.generate_csv()
-            csv_file_path = os.path.join(csv_output_dir, f"{os.path.splitext(replay_file)[0]}_{rattleplayer.game.game_playlist}_{rattleplayer.game.game_region}.csv")
-            with open(csv_file_path, 'w') as csv_file:
-                csv_file.write(csv_data)
+    print(f"Parsed {parsed} of {len(replay_paths)} replays ({cached} from cache) in {time.perf_counter() - start:.2f}s")
+    for result in failed:
+        print(f"  failed: {result['replay']}: {result['error']}")
 
-            print(f"CSV for {replay_file} written to {csv_file_path}")
+    if stats_db:
+        with StatsStore(stats_db) as store:
+            added = store.add_matches(records, timelines=stats_timelines)
+        print(f"Stored {added} new matches in {stats_db}")
 
-        except Exception as e:
-            print(f"Error parsing {replay_file}: {str(e)}")
+    if cache is not None:
+        evicted = cache.evict()
+        if evicted:
+            print(f"Evicted {evicted} replays from the parse cache")
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import argparse
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from parse_cache import ParseCache
+from rattleplayer import get_validator
+from replays_convert import convert_replay
+from replays_csv import parse_replay
+from stats_store import StatsStore
+
+# state kept by each worker process between replays, see init_worker()
+worker_cache = None
+worker_scheduler = None
+
+
+def init_worker(cache_dir, cache_max_bytes, analyze=True):
+    """Loads what every replay needs once per worker process."""
+    global worker_cache, worker_scheduler
+    # Ctrl-C is for the main process, which lets running replays finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cache_dir:
+        worker_cache = ParseCache(cache_dir, cache_max_bytes)
+    get_validator("section-header")
+    get_validator("frame")
+    if analyze:
+        # pulls in matplotlib and the OpenAI package
+        import replays_analyze
+        worker_scheduler = replays_analyze.make_scheduler()
+
+
+def process_replay(replay_path, json_dir, csv_output_dir, output_dir, analyze=True):
+    """Runs one replay through convert, parse and analyze in a worker."""
+    start = time.perf_counter()
+    result = {"replay": replay_path, "error": None, "stats": None, "feedback": None, "csv": None}
+
+    converted = convert_replay(replay_path, json_dir)
+    if converted["status"] == "failed":
+        result["error"] = f"convert: {converted['error']}"
+    else:
+        parsed = parse_replay(converted["json"], csv_output_dir, worker_cache)
+        result["stats"] = parsed["stats"]
+        result["csv"] = parsed["csv"]
+        if parsed["error"] is not None:
+            result["error"] = f"parse: {parsed['error']}"
+        elif analyze:
+            import replays_analyze
+            try:
+                result["feedback"] = replays_analyze.analyze_match(parsed["csv"], output_dir, worker_scheduler)
+            except Exception as e:
+                result["error"] = f"analyze: {e}"
+
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def update_session_summary(session, feedback):
+    """Condenses new feedback into the session summary and saves it, off the polling loop."""
+    import replays_analyze
+    # only the new matches are condensed, and the merges above them redone
+    session_summary = replays_analyze.generate_session_summary(session, feedback)
+    if session_summary:
+        replays_analyze.save_session_summary(session_summary)
+    else:
+        print("Failed to update the session summary.")
+
+
+class ReplayWatcher:
+    """Polls a folder for replays and reports the ones that finished writing.
+
+    A replay is ready once its size and mtime stayed the same for settle
+    seconds, so files the game is still writing are left alone. Each file
+    is reported once, again only if it is rewritten.
+    """
+
+    def __init__(self, replay_dir, settle=3.0, skip_existing=True):
+        self.replay_dir = replay_dir
+        self.settle = settle
+        self.pending = {}
+        self.done = {}
+        if skip_existing:
+            self.done = self.scan()
+
+    def scan(self):
+        files = {}
+        for entry in os.scandir(self.replay_dir):
+            if entry.is_file() and entry.name.lower().endswith(".replay"):
+                stat = entry.stat()
+                files[entry.path] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def poll(self):
+        """Returns the replays that are new or changed and have settled."""
+        now = time.monotonic()
+        ready = []
+        for path, signature in self.scan().items():
+            if self.done.get(path) == signature:
+                continue
+            previous = self.pending.get(path)
+            if previous is None or previous[0] != signature:
+                self.pending[path] = (signature, now)
+            elif now - previous[1] >= self.settle:
+                del self.pending[path]
+                self.done[path] = signature
+                ready.append(path)
+        return sorted(ready)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coach new replays as they appear.")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between polls")
+    parser.add_argument("--settle", type=float, default=3.0, help="seconds a replay must stay unchanged")
+    parser.add_argument("--all", action="store_true", help="also process replays already in the folder")
+    parser.add_argument("--no-analyze", action="store_true", help="stop after the csv and stats")
+    args = parser.parse_args()
+
+    replay_dir = os.getenv("RL_REPLAY_DIR", os.getcwd())
+    workers = int(os.getenv("RL_WORKERS", 0)) or 2
+    cache_dir = os.getenv("RL_CACHE_DIR", os.path.join(os.getcwd(), 'cache'))
+    cache_max_mb = int(os.getenv("RL_CACHE_MAX_MB", 2048))
+    stats_db = os.getenv("RL_STATS_DB", os.path.join(os.getcwd(), 'stats.db'))
+    stats_timelines = os.getenv("RL_STATS_TIMELINES", "0") == "1"
+
+    json_dir = os.path.join(os.getcwd(), 'json')
+    csv_output_dir = os.path.join(os.getcwd(), 'csv')
+    output_dir = os.path.join(os.getcwd(), 'output')
+    for directory in [json_dir, csv_output_dir, output_dir]:
+        os.makedirs(directory, exist_ok=True)
+
+    if not args.no_analyze:
+        # the session summary is updated in this process, one update at a time
+        import replays_analyze
+        session = replays_analyze.make_session(replays_analyze.make_scheduler())
+
+    watcher = ReplayWatcher(replay_dir, args.settle, skip_existing=not args.all)
+    store = StatsStore(stats_db) if stats_db else None
+    # the workers only add to the cache, this process keeps it within its size
+    cache = ParseCache(cache_dir, cache_max_mb << 20) if cache_dir else None
+    running = {}
+    # feedback waiting for the next session summary update, by csv name
+    new_feedback = {}
+    summary_update = None
+
+    print(f"Watching {replay_dir} with {workers} workers, Ctrl-C to stop")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(cache_dir, cache_max_mb << 20, not args.no_analyze),
+    ) as executor, ThreadPoolExecutor(max_workers=1) as summarizer:
+        try:
+            while True:
+                for replay_path in watcher.poll():
+                    print(f"New replay {replay_path}")
+                    running[replay_path] = executor.submit(
+                        process_replay, replay_path, json_dir, csv_output_dir, output_dir, not args.no_analyze
+                    )
+
+                for replay_path, future in list(running.items()):
+                    if not future.done():
+                        continue
+                    del running[replay_path]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"Error processing {replay_path}: {e}")
+                        continue
+                    if result["stats"] is not None and store is not None:
+                        store.add_matches([result["stats"]], timelines=stats_timelines)
+                    if cache is not None:
+                        evicted = cache.evict()
+                        if evicted:
+                            print(f"Evicted {evicted} replays from the parse cache")
+                    if result["error"] is not None:
+                        print(f"Error processing {replay_path}: {result['error']}")
+                    else:
+                        print(f"Coached {replay_path} in {result['seconds']:.2f}s")
+                        if result["feedback"]:
+                            print(result["feedback"])
+                            new_feedback[os.path.basename(result["csv"])] = result["feedback"]
+
+                # the LLM requests of a summary update would hold up polling,
+                # so they run in the background; replays coached meanwhile
+                # go into the next update
+                if summary_update is not None and summary_update.done():
+                    try:
+                        summary_update.result()
+                    except Exception as e:
+                        print(f"Error updating the session summary: {e}")
+                    summary_update = None
+                if new_feedback and summary_update is None:
+                    summary_update = summarizer.submit(update_session_summary, session, new_feedback)
+                    new_feedback = {}
+
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            print("Stopping, waiting for replays in progress")
+        finally:
+            if store is not None:
+                store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+
+# summaries merged by one request
+BATCH_SIZE = 8
+
+CONDENSE_PROMPT = (
+    "Condense the following coaching feedback for one Rocket League match into its key points: "
+    "the main strengths, the main mistakes and what to practice, in at most 150 words.\n\n"
+)
+MERGE_PROMPT = (
+    "Merge the following summaries of coaching feedback for Rocket League matches into one summary "
+    "of at most 300 words. Keep recurring strengths and mistakes and note how they change over the matches.\n\n"
+)
+SESSION_PROMPT = (
+    "Please provide a session-wide summary of the following coaching feedback for Rocket League matches, "
+    "each already condensed, oldest first:\n\n"
+)
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class SessionSummary:
+    """Session summary built from per-match feedback by map-reduce.
+
+    Each match's feedback is condensed once, then batches of batch_size
+    summaries are merged level by level until one is left. Requests of one
+    level run concurrently through the scheduler. Condensed matches and
+    merges are kept in a json state file keyed by a hash of their input,
+    so a new match only costs its own condense and the merges above it.
+    """
+
+    def __init__(self, state_path, scheduler, batch_size=BATCH_SIZE):
+        self.state_path = state_path
+        self.scheduler = scheduler
+        self.batch_size = batch_size
+        self.state = {"matches": {}, "merges": {}}
+        if state_path and os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def save(self):
+        if not self.state_path:
+            return
+        partial_path = f"{self.state_path}.{os.getpid()}.partial"
+        with open(partial_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(partial_path, self.state_path)
+
+    def condense(self, feedback):
+        """Condenses the feedback of each match, a dict by name, unless done before.
+
+        Matches are kept in the order they were first condensed.
+        """
+        matches = self.state["matches"]
+        changed = [
+            name for name, text in feedback.items()
+            if name not in matches or matches[name]["hash"] != text_hash(text)
+        ]
+        if not changed:
+            return
+        condensed = self.scheduler.complete_all(
+            [CONDENSE_PROMPT + feedback[name] for name in changed], max_tokens=400
+        )
+        for name, summary in zip(changed, condensed):
+            if summary:
+                matches[name] = {"hash": text_hash(feedback[name]), "summary": summary}
+        self.save()
+
+    def summarize(self, names=None):
+        """Returns the summary of the named condensed matches, by default all of them.
+
+        None when there are no matches or a merge failed.
+        """
+        matches = self.state["matches"]
+        level = [
+            f"## {name}\n\n{match['summary']}" for name, match in matches.items()
+            if names is None or name in names
+        ]
+        if not level:
+            return None
+
+        merges = {}
+        while True:
+            batches = [level[i:i + self.batch_size] for i in range(0, len(level), self.batch_size)]
+            prefix = SESSION_PROMPT if len(batches) == 1 else MERGE_PROMPT
+            prompts = [prefix + "\n\n".join(batch) for batch in batches]
+            keys = [text_hash(prompt) for prompt in prompts]
+
+            missing = [i for i, key in enumerate(keys) if key not in self.state["merges"]]
+            if missing:
+                results = self.scheduler.complete_all([prompts[i] for i in missing], max_tokens=800)
+                for i, result in zip(missing, results):
+                    if result:
+                        self.state["merges"][keys[i]] = result
+            if any(key not in self.state["merges"] for key in keys):
+                self.save()
+                return None
+
+            merges.update({key: self.state["merges"][key] for key in keys})
+            level = [merges[key] for key in keys]
+            if len(batches) == 1:
+                break
+
+        # merges of earlier sessions are never asked for again
+        self.state["merges"] = merges
+        self.save()
+        return level[0]
@@ -0,0 +1,291 @@
+import sqlite3
+
+import numpy as np
+
+from downsample import adaptive_frames
+from replay_parse import end_of_day, parse_date
+
+# seconds between the timeline samples match_record() keeps in quiet play,
+# busier play is sampled more often
+SAMPLE_INTERVAL = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    match_guid TEXT PRIMARY KEY,
+    replay TEXT,
+    map_name TEXT,
+    playlist TEXT,
+    region TEXT,
+    match_type TEXT,
+    team_size INTEGER,
+    date TEXT,
+    num_frames INTEGER,
+    duration REAL,
+    team0_score INTEGER,
+    team1_score INTEGER
+);
+CREATE TABLE IF NOT EXISTS player_stats (
+    match_guid TEXT NOT NULL REFERENCES matches(match_guid),
+    entity INTEGER NOT NULL,
+    player_name TEXT NOT NULL,
+    team INTEGER,
+    score INTEGER,
+    goals INTEGER,
+    assists INTEGER,
+    saves INTEGER,
+    shots INTEGER,
+    frames INTEGER,
+    avg_speed REAL,
+    avg_boost REAL,
+    avg_distance_to_ball REAL,
+    supersonic_fraction REAL,
+    PRIMARY KEY (match_guid, entity)
+);
+CREATE TABLE IF NOT EXISTS timeline_samples (
+    match_guid TEXT NOT NULL REFERENCES matches(match_guid),
+    entity INTEGER NOT NULL,
+    player_name TEXT NOT NULL,
+    time REAL NOT NULL,
+    location_x REAL,
+    location_y REAL,
+    location_z REAL,
+    speed REAL,
+    boost REAL,
+    distance_to_ball REAL
+);
+CREATE INDEX IF NOT EXISTS player_stats_player ON player_stats (player_name);
+CREATE INDEX IF NOT EXISTS matches_playlist ON matches (playlist);
+CREATE INDEX IF NOT EXISTS matches_map ON matches (map_name);
+CREATE INDEX IF NOT EXISTS matches_date ON matches (date);
+CREATE INDEX IF NOT EXISTS timeline_samples_match ON timeline_samples (match_guid, player_name);
+"""
+
+MATCH_COLUMNS = [
+    "match_guid", "replay", "map_name", "playlist", "region", "match_type", "team_size",
+    "date", "num_frames", "duration", "team0_score", "team1_score",
+]
+
+# entity is the player's column in the Timeline, names need not be unique
+PLAYER_COLUMNS = [
+    "entity", "player_name", "team", "score", "goals", "assists", "saves", "shots", "frames",
+    "avg_speed", "avg_boost", "avg_distance_to_ball", "supersonic_fraction",
+]
+
+SAMPLE_COLUMNS = [
+    "entity", "player_name", "time", "location_x", "location_y", "location_z",
+    "speed", "boost", "distance_to_ball",
+]
+
+
+def mean_or_none(values):
+    values = values[~np.isnan(values)]
+    return float(values.mean()) if len(values) else None
+
+
+def match_record(replay_file, game, timeline):
+    """Collects what the store keeps of one parsed replay as plain data.
+
+    game is the ReplayParse after the last frame and timeline its derived
+    Timeline. The record pickles and serializes to json, so workers can
+    send it back and the parse cache can keep it.
+    """
+    header_stats = {stats.get("Name"): stats for stats in game.find_array_property("PlayerStats")}
+    num_frames = timeline.num_frames
+
+    players = []
+    for entity in range(1, len(timeline.entities)):
+        present = timeline.present[:, entity]
+        if not present.any():
+            continue
+        player_name = timeline.entities[entity]
+        stats = header_stats.get(player_name, {})
+        speed = timeline.speed[present, entity]
+        # no distance while there is no ball
+        with_ball = present & timeline.present[:, 0]
+        players.append({
+            "entity": entity,
+            "player_name": player_name,
+            "team": stats.get("Team", int(timeline.team[present, entity][-1])),
+            "score": stats.get("Score"),
+            "goals": stats.get("Goals"),
+            "assists": stats.get("Assists"),
+            "saves": stats.get("Saves"),
+            "shots": stats.get("Shots"),
+            "frames": int(present.sum()),
+            # -1 marks a car without a replicated velocity
+            "avg_speed": mean_or_none(np.where(speed < 0, np.nan, speed)),
+            "avg_boost": mean_or_none(timeline.boost[present, entity]),
+            "avg_distance_to_ball": mean_or_none(timeline.distance_to_ball[with_ball, entity]),
+            "supersonic_fraction": float(timeline.supersonic[present, entity].mean()),
+        })
+
+    samples = []
+    if num_frames:
+        num_entities = len(timeline.entities)
+        # the ball is always at distance 0 from itself
+        distance_to_ball = timeline.distance_to_ball[:, :num_entities].copy()
+        distance_to_ball[:, 0] = np.nan
+        sample_frames = adaptive_frames(
+            timeline.time,
+            np.where(timeline.present[:, :num_entities, None], timeline.position[:, :num_entities], np.nan),
+            timeline.linear_velocity[:, :num_entities],
+            distance_to_ball,
+            quiet_interval=SAMPLE_INTERVAL,
+        )
+        for frame in sample_frames:
+            for entity, player_name in enumerate(timeline.entities):
+                if not timeline.present[frame, entity]:
+                    continue
+                x, y, z = timeline.position[frame, entity]
+                speed = timeline.speed[frame, entity]
+                values = [float(timeline.time[frame]), x, y, z,
+                          # -1 marks a car without a replicated velocity
+                          np.nan if speed < 0 else speed,
+                          timeline.boost[frame, entity], timeline.distance_to_ball[frame, entity]]
+                samples.append([entity, player_name] + [
+                    None if np.isnan(value) else float(value) for value in values
+                ])
+
+    return {
+        "match_guid": game.find_property("MatchGuid") or game.find_property("Id"),
+        "replay": replay_file,
+        "map_name": game.map_name,
+        "playlist": game.game_playlist,
+        "region": game.game_region,
+        "match_type": game.find_property("MatchType"),
+        "team_size": game.find_property("TeamSize"),
+        "date": parse_date(game.find_property("Date")),
+        "num_frames": num_frames,
+        "duration": float(timeline.time[-1] - timeline.time[0]) if num_frames else 0.0,
+        "team0_score": game.find_property("Team0Score") or 0,
+        "team1_score": game.find_property("Team1Score") or 0,
+        "players": players,
+        "samples": samples,
+    }
+
+
+class StatsStore:
+    """SQLite store of match metadata and per-player aggregates across replays.
+
+    Matches are keyed by their MatchGuid; adding a match that is already
+    stored does nothing, so the same replays can be added on every run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def has_match(self, match_guid):
+        row = self.connection.execute(
+            "SELECT 1 FROM matches WHERE match_guid = ?", (match_guid,)
+        ).fetchone()
+        return row is not None
+
+    def add_matches(self, records, timelines=False):
+        """Stores match_record()s in one transaction, returns how many were new.
+
+        With timelines, the downsampled timeline samples are stored too.
+        """
+        added = 0
+        with self.connection:
+            for record in records:
+                if record["match_guid"] is None:
+                    continue
+                cursor = self.connection.execute(
+                    f"INSERT OR IGNORE INTO matches ({', '.join(MATCH_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(MATCH_COLUMNS))})",
+                    [record[column] for column in MATCH_COLUMNS],
+                )
+                if cursor.rowcount == 0:
+                    continue
+                added += 1
+                self.connection.executemany(
+                    f"INSERT INTO player_stats (match_guid, {', '.join(PLAYER_COLUMNS)}) "
+                    f"VALUES (?, {', '.join('?' * len(PLAYER_COLUMNS))})",
+                    [[record["match_guid"]] + [player[column] for column in PLAYER_COLUMNS]
+                     for player in record["players"]],
+                )
+                if timelines:
+                    self.connection.executemany(
+                        f"INSERT INTO timeline_samples (match_guid, {', '.join(SAMPLE_COLUMNS)}) "
+                        f"VALUES (?, {', '.join('?' * len(SAMPLE_COLUMNS))})",
+                        [[record["match_guid"]] + sample for sample in record["samples"]],
+                    )
+        return added
+
+    def matches(self, player=None, playlist=None, map_name=None, since=None, until=None, limit=None):
+        """Returns matches as dicts, newest first, filtered by any of the arguments."""
+        query = "SELECT m.* FROM matches m"
+        conditions, parameters = self.filters(playlist, map_name, since, until)
+        if player is not None:
+            conditions.append(
+                "EXISTS (SELECT 1 FROM player_stats p"
+                " WHERE p.match_guid = m.match_guid AND p.player_name = ?)"
+            )
+            parameters.append(player)
+        return self.select(query, conditions, parameters, limit)
+
+    def player_history(self, player, playlist=None, map_name=None, since=None, until=None, limit=None):
+        """Returns the player's per-match stats joined with the match, newest first."""
+        query = (
+            "SELECT m.date, m.map_name, m.playlist, p.* FROM player_stats p"
+            " JOIN matches m ON m.match_guid = p.match_guid"
+        )
+        conditions, parameters = self.filters(playlist, map_name, since, until)
+        conditions.append("p.player_name = ?")
+        parameters.append(player)
+        return self.select(query, conditions, parameters, limit)
+
+    def player_trend(self, player, metric="avg_distance_to_ball", last=200, **filters):
+        """Returns (date, value) of metric over the player's last matches, oldest first."""
+        if metric not in PLAYER_COLUMNS:
+            raise ValueError(f'Unknown metric "{metric}"')
+        history = self.player_history(player, limit=last, **filters)
+        return [(row["date"], row[metric]) for row in reversed(history)]
+
+    def timeline(self, match_guid, player=None):
+        """Returns the stored timeline samples of a match, by time."""
+        query = "SELECT * FROM timeline_samples"
+        conditions, parameters = ["match_guid = ?"], [match_guid]
+        if player is not None:
+            conditions.append("player_name = ?")
+            parameters.append(player)
+        rows = self.connection.execute(
+            f"{query} WHERE {' AND '.join(conditions)} ORDER BY time", parameters
+        )
+        return [dict(row) for row in rows]
+
+    def filters(self, playlist, map_name, since, until):
+        """Conditions on the matches m; since and until are ISO dates or datetimes, inclusive."""
+        conditions, parameters = [], []
+        for condition, value in [
+            ("m.playlist = ?", playlist),
+            ("m.map_name = ?", map_name),
+            ("m.date >= ?", since),
+            ("m.date <= ?", end_of_day(until)),
+        ]:
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        return conditions, parameters
+
+    def select(self, query, conditions, parameters, limit):
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY m.date DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters = parameters + [limit]
+        return [dict(row) for row in self.connection.execute(query, parameters)]
@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+
+from constants import *
+from replay_parse import CSV_HEADERS
+
+# columns only a derived Timeline can provide
+DERIVED_HEADERS = [
+    "speed_kmh",
+    "supersonic",
+    "distance_to_goal_0",
+    "distance_to_goal_1",
+]
+
+
+class Timeline:
+    """Per-frame state of the ball and every player in preallocated arrays.
+
+    Entity 0 is the ball, players follow in order of appearance. Arrays are
+    indexed [frame, entity, ...]; values an entity did not have in a frame
+    are NaN (team is -1) and present[frame, entity] tells whether the entity
+    was on the field at all. Speeds, distances and the ball angle are filled
+    in by derive() once all frames are recorded.
+    """
+
+    def __init__(self, num_frames, num_entities=8):
+        self.num_frames = num_frames
+        self.time = np.zeros(num_frames)
+        self.entities = ["ball"]
+        self.entity_index = {}
+        self.num_entities = 0
+        self.present = np.zeros((num_frames, 0), dtype=bool)
+        self.team = np.zeros((num_frames, 0), dtype=np.int8)
+        self.boost = np.zeros((num_frames, 0))
+        self.position = np.zeros((num_frames, 0, 3))
+        self.quaternion = np.zeros((num_frames, 0, 4))
+        self.linear_velocity = np.zeros((num_frames, 0, 3))
+        self.angular_velocity = np.zeros((num_frames, 0, 3))
+        self.derived = False
+        self.grow(num_entities)
+
+    def grow(self, num_entities):
+        """Makes room for num_entities entities, keeping what is recorded."""
+        extra = num_entities - self.num_entities
+        shape = (self.num_frames, extra)
+        self.present = np.concatenate([self.present, np.zeros(shape, dtype=bool)], axis=1)
+        self.team = np.concatenate([self.team, np.full(shape, -1, dtype=np.int8)], axis=1)
+        for name in ["boost"]:
+            grown = np.concatenate([getattr(self, name), np.full(shape, np.nan)], axis=1)
+            setattr(self, name, grown)
+        for name, size in [("position", 3), ("quaternion", 4), ("linear_velocity", 3), ("angular_velocity", 3)]:
+            grown = np.concatenate([getattr(self, name), np.full(shape + (size,), np.nan)], axis=1)
+            setattr(self, name, grown)
+        self.num_entities = num_entities
+
+    def resize(self, num_frames):
+        """Grows or truncates the frame axis to num_frames frames."""
+        for name in ["time", "present", "team", "boost", "position", "quaternion", "linear_velocity", "angular_velocity"]:
+            values = getattr(self, name)
+            if num_frames <= self.num_frames:
+                values = values[:num_frames]
+            else:
+                if values.dtype == bool:
+                    fill = False
+                elif values.dtype == np.int8:
+                    fill = -1
+                else:
+                    fill = np.nan
+                extra = np.full((num_frames - self.num_frames,) + values.shape[1:], fill, dtype=values.dtype)
+                values = np.concatenate([values, extra])
+            setattr(self, name, values)
+        self.num_frames = num_frames
+
+    def finish(self, num_frames):
+        """Trims the timeline to the num_frames recorded and derives metrics."""
+        # a streamed replay is sized by its header's NumFrames
+        if num_frames != self.num_frames:
+            self.resize(num_frames)
+        self.derive()
+
+    def add_player(self, player):
+        entity = len(self.entities)
+        if entity == self.num_entities:
+            self.grow(2 * self.num_entities)
+        self.entities.append("unknown player")
+        self.entity_index[player] = entity
+        return entity
+
+    def record(self, frame_index, replay):
+        """Copies the state of replay after its update(frame_index, ...)."""
+        if frame_index >= self.num_frames:
+            self.resize(max(2 * self.num_frames, frame_index + 1))
+        self.time[frame_index] = replay.time
+        kinematics = replay.kinematics
+
+        for player, car in replay.player_car_pairs:
+            entity = self.entity_index.get(player)
+            if entity is None:
+                entity = self.add_player(player)
+            player_name = replay.actors[player].player_name
+            if player_name is not None:
+                self.entities[entity] = player_name
+
+            car = replay.actors[car]
+            self.present[frame_index, entity] = True
+            self.team[frame_index, entity] = car.team
+            self.boost[frame_index, entity] = car.boost
+            self.position[frame_index, entity] = kinematics.get_location(car.slot)
+            self.quaternion[frame_index, entity] = kinematics.get_rotation(car.slot)
+            self.linear_velocity[frame_index, entity] = kinematics.get_linear_velocity(car.slot)
+            self.angular_velocity[frame_index, entity] = kinematics.get_angular_velocity(car.slot)
+
+        if replay.ball_id is not None:
+            ball = replay.actors[replay.ball_id]
+            self.present[frame_index, 0] = True
+            self.position[frame_index, 0] = kinematics.get_location(ball.slot)
+            self.quaternion[frame_index, 0] = kinematics.get_rotation(ball.slot)
+            self.linear_velocity[frame_index, 0] = kinematics.get_linear_velocity(ball.slot)
+            self.angular_velocity[frame_index, 0] = kinematics.get_angular_velocity(ball.slot)
+
+    def derive(self):
+        """Computes speeds, distances and the ball angle for all frames at once."""
+        num_entities = len(self.entities)
+        present = self.present[:, :num_entities]
+        velocity = self.linear_velocity[:, :num_entities]
+        position = self.position[:, :num_entities]
+
+        speed = np.sqrt(np.sum(velocity ** 2, axis=2))
+        self.speed_kmh = speed * UU_TO_KMH_FACTOR
+        self.supersonic = speed >= CAR_SUPERSONIC_SPEED
+        # cars without a replicated velocity report -1, as calculate() does
+        speed[:, 1:][present[:, 1:] & np.isnan(speed[:, 1:])] = -1.0
+        self.speed = speed
+        self.ball_angle = np.arctan2(velocity[:, 0, 1], velocity[:, 0, 0])
+
+        # no distance while there is no ball, as in ReplayParse.calculate()
+        ball_position = np.where(present[:, :1, None], position[:, :1], np.nan)
+        self.distance_to_ball = np.sqrt(np.sum((position - ball_position) ** 2, axis=2))
+        goals = np.array(GOAL_LOCATIONS)
+        self.distance_to_goal = np.sqrt(
+            np.sum((position[:, :, None, :] - goals) ** 2, axis=3)
+        )
+        self.derived = True
+
+    def to_frame(self, columns=CSV_HEADERS):
+        """Returns the timeline as a DataFrame, by default with the csv columns.
+
+        Rows are ordered by frame, players first and the ball last, and the
+        ball only carries its location, like the rows of ReplayParse.dump().
+        Pass CSV_HEADERS + DERIVED_HEADERS for the metrics derive() adds.
+        """
+        if not self.derived:
+            self.derive()
+        order = np.array(list(range(1, len(self.entities))) + [0])
+        frames, ordered = np.nonzero(self.present[:, order])
+        entities = order[ordered]
+        is_ball = entities == 0
+
+        def player_only(values):
+            values = values[frames, entities].astype(float)
+            values[is_ball] = np.nan
+            return values
+
+        team = pd.array(self.team[frames, entities], dtype="Int64")
+        team[is_ball] = pd.NA
+        boost = pd.array(np.nan_to_num(self.boost[frames, entities]).astype(int), dtype="Int64")
+        boost[is_ball] = pd.NA
+
+        data = {
+            "time": self.time[frames],
+            "player_name": np.array(self.entities, dtype=object)[entities],
+            "team": team,
+            "boost": boost,
+        }
+        for axis, name in enumerate("xyz"):
+            data[f"location_{name}"] = self.position[frames, entities, axis]
+        for axis, name in enumerate("xyzw"):
+            data[f"rotation_{name}"] = player_only(self.quaternion[..., axis])
+        for axis, name in enumerate("xyz"):
+            data[f"linear_velocity_{name}"] = player_only(self.linear_velocity[..., axis])
+        for axis, name in enumerate("xyz"):
+            data[f"angular_velocity_{name}"] = player_only(self.angular_velocity[..., axis])
+        data["speed"] = player_only(self.speed)
+        data["distance_to_ball"] = player_only(self.distance_to_ball)
+        data["speed_kmh"] = player_only(self.speed_kmh)
+        data["supersonic"] = self.supersonic[frames, entities] & ~is_ball
+        data["distance_to_goal_0"] = player_only(self.distance_to_goal[..., 0])
+        data["distance_to_goal_1"] = player_only(self.distance_to_goal[..., 1])
+        return pd.DataFrame(data, columns=columns)
+
+    def to_csv(self, path_or_buf):
+        """Writes the timeline in the same layout as RattlePlayer.generate_csv()."""
+        self.to_frame().to_csv(path_or_buf, index=False)
+
+    def save(self, path):
+        """Writes the csv columns to a typed .npz that load_frame() reads back.
+
+        Player names are stored once with per-row codes, kinematics as
+        float32, and team and boost as integers with -1 on ball rows.
+        """
+        frame = self.to_frame()
+        player_names = frame["player_name"].astype("category")
+        arrays = {
+            "player_names": np.array(player_names.cat.categories, dtype=str),
+            "player_name": player_names.cat.codes.to_numpy(np.int16),
+            "time": frame["time"].to_numpy(np.float64),
+            "team": frame["team"].fillna(-1).to_numpy(np.int8),
+            "boost": frame["boost"].fillna(-1).to_numpy(np.int16),
+        }
+        for column in CSV_HEADERS[4:]:
+            arrays[column] = frame[column].to_numpy(np.float32)
+        np.savez(path, **arrays)
+
+
+def concatenate(timelines):
+    """Joins timelines of consecutive frame ranges of one replay.
+
+    Players are matched by the PRI id they were recorded under, the ball
+    stays entity 0. The result is derived.
+    """
+    result = Timeline(sum(timeline.num_frames for timeline in timelines))
+    start = 0
+    for timeline in timelines:
+        end = start + timeline.num_frames
+        targets = np.zeros(len(timeline.entities), dtype=int)
+        for player, entity in sorted(timeline.entity_index.items(), key=lambda item: item[1]):
+            target = result.entity_index.get(player)
+            if target is None:
+                target = result.add_player(player)
+            if timeline.entities[entity] != "unknown player":
+                result.entities[target] = timeline.entities[entity]
+            targets[entity] = target
+
+        num_entities = len(timeline.entities)
+        result.time[start:end] = timeline.time
+        for name in ["present", "team", "boost", "position", "quaternion", "linear_velocity", "angular_velocity"]:
+            getattr(result, name)[start:end, targets] = getattr(timeline, name)[:, :num_entities]
+        start = end
+
+    result.derive()
+    return result
+
+
+def load_frame(path):
+    """Reads a .npz written by Timeline.save() as a DataFrame of csv columns."""
+    with np.load(path, allow_pickle=False) as arrays:
+        data = {column: arrays[column] for column in CSV_HEADERS if column != "player_name"}
+        data["player_name"] = pd.Categorical.from_codes(
+            arrays["player_name"], arrays["player_names"]
+        )
+    return pd.DataFrame(data, columns=CSV_HEADERS)
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+# the modules import each other by their flat names, like the scripts do
+sys.path.insert(0, os.path.join(ROOT, "rocketleague_replay_coach"))
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # schema.json is looked up in the working directory
+    monkeypatch.chdir(ROOT)
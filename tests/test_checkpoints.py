@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from checkpoints import ReplayCheckpoints
+from conftest import FIXTURES
+from rattleplayer import RattlePlayer
+
+# 40 frames with a goal at frame 12
+GAP_REPLAY = os.path.join(FIXTURES, "goal_demolition.replay.json")
+# a cut of a longer replay, its goal is past the last frame
+SORTED_REPLAY = os.path.join(FIXTURES, "sorted_keys.replay.json")
+
+
+def test_goal_window_clamped():
+    checkpoints = ReplayCheckpoints(GAP_REPLAY)
+    with RattlePlayer(GAP_REPLAY) as player:
+        whole = player.generate_timeline()
+    # five seconds before the goal reach back past frame 0
+    window = checkpoints.goal_window(0, before=5.0, after=0.1)
+    assert window.num_frames == 12 + 4
+    assert (window.present[:, :5] == whole.present[:16, :5]).all()
+    assert checkpoints.window(-10.0, 100.0).num_frames == len(checkpoints.times)
+
+
+def test_goal_window_out_of_range():
+    checkpoints = ReplayCheckpoints(GAP_REPLAY)
+    with pytest.raises(ValueError, match="goal 1 out of range"):
+        checkpoints.goal_window(1)
+    with pytest.raises(ValueError, match="at frame 300"):
+        ReplayCheckpoints(SORTED_REPLAY).goal_window(0)
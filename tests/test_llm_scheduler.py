@@ -0,0 +1,53 @@
+import random
+import threading
+
+import pytest
+from openai import AsyncOpenAI
+
+from llm_scheduler import LLMScheduler
+from mock_openai import make_server
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**settings):
+        server = make_server(port=0, **settings)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def scheduler_for(server, **settings):
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    return LLMScheduler(
+        client_factory=lambda: AsyncOpenAI(base_url=base_url, api_key="mock", max_retries=0),
+        **settings,
+    )
+
+
+def test_results_in_order_despite_failures(mock_server):
+    random.seed(3)
+    server = mock_server(latency=0.01, rate_limit_rate=0.2, error_rate=0.3, retry_after=0.01)
+    scheduler = scheduler_for(server, concurrency=4, max_retries=30, backoff=0.01, max_backoff=0.05)
+    prompts = ["x" * length for length in range(10, 30)]
+
+    completions = scheduler.complete_all(prompts)
+
+    assert completions == [f"Mock feedback for a prompt of {len(prompt)} characters." for prompt in prompts]
+    # failed attempts were sent again
+    assert server.requests > len(prompts)
+
+
+def test_timeout_fails_the_request(mock_server):
+    server = mock_server(latency=1.0)
+    scheduler = scheduler_for(server, timeout=0.05, max_retries=1, backoff=0.01)
+
+    assert scheduler.complete_all(["slow"]) == [None]
+    assert server.requests == 2
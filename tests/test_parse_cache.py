@@ -0,0 +1,21 @@
+import os
+import time
+
+from parse_cache import ParseCache
+
+
+def test_evict_removes_partials_of_dead_workers(tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+    live = tmp_path / "cache" / f"abc.{os.getpid()}.partial"
+    dead = tmp_path / "cache" / "abc.999999999.partial"
+    old = tmp_path / "cache" / f"def.{os.getpid()}.partial"
+    for partial in [live, dead, old]:
+        partial.mkdir()
+        (partial / "replay.csv").write_text("time\n")
+    os.utime(old, (time.time() - 2 * 3600,) * 2)
+
+    cache.evict()
+
+    assert live.exists()
+    assert not dead.exists()
+    assert not old.exists()
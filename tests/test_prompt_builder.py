@@ -0,0 +1,46 @@
+import io
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import FIXTURES
+from prompt_builder import build_prompt, estimate_tokens, player_legend, summarize
+from rattleplayer import RattlePlayer
+
+
+@pytest.fixture(scope="module")
+def match():
+    return RattlePlayer(os.path.join(FIXTURES, "sorted_keys.replay.json")).generate_timeline().to_frame()
+
+
+@pytest.mark.parametrize("token_budget", [400, 600, 1000, 2000, 8000])
+def test_prompt_within_budget(match, token_budget):
+    prompt, tokens = build_prompt("Coach this match.", match, token_budget)
+
+    assert tokens == estimate_tokens(prompt)
+    assert tokens <= token_budget
+
+
+def test_prompt_has_rows_when_they_fit(match):
+    prompt, _ = build_prompt("Coach this match.", match, 8000)
+
+    assert "Sampled every" in prompt
+    assert prompt.rstrip().splitlines()[-1].count(";") == 6
+
+
+def test_summary_of_csv_without_ball_frames():
+    with RattlePlayer(os.path.join(FIXTURES, "sorted_keys.replay.json")) as player:
+        match = pd.read_csv(io.StringIO(player.generate_csv()))
+    legend, teams = player_legend(match)
+    lines, _ = summarize(match, legend, teams)
+
+    # teams read from a csv are floats
+    assert all(" team 0: " in line or " team 1: " in line for line in lines)
+    # a stand-in distance in frames without a ball does not count
+    no_ball = match["time"] < match["time"].unique()[10]
+    expected = match[~no_ball].groupby("player_name")["distance_to_ball"].mean()
+    match = match[~(no_ball & (match["player_name"] == "ball"))].copy()
+    match.loc[no_ball, "distance_to_ball"] = 999999.0
+    for line, name in zip(summarize(match, legend, teams)[0], teams.index):
+        assert f"avg distance to ball {expected[name]:.0f} uu" in line
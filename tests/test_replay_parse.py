@@ -0,0 +1,50 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from conftest import FIXTURES
+from rattleplayer import RattlePlayer
+
+# the ball is destroyed by a goal at frame 12 and the kickoff ball spawns at
+# frame 20; Bob is demolished at frame 15 and his car respawns at frame 25
+GAP_REPLAY = os.path.join(FIXTURES, "goal_demolition.replay.json")
+
+
+def replay_csv(path):
+    return pd.read_csv(io.StringIO(RattlePlayer(path).generate_csv()))
+
+
+def test_ball_kept_until_kickoff():
+    data = replay_csv(GAP_REPLAY)
+    frames = data["time"].unique()
+    ball = data[data["player_name"] == "ball"]
+    assert list(ball["time"]) == list(frames)
+    # the destroyed ball stays at its last position until the new one spawns
+    gap = ball[(ball["time"] >= frames[12]) & (ball["time"] < frames[20])]
+    assert len(gap[["location_x", "location_y", "location_z"]].drop_duplicates()) == 1
+
+    cars = data[data["player_name"] != "ball"]
+    assert cars["distance_to_ball"].notna().all()
+    assert cars["distance_to_ball"].max() < 20000
+
+
+def test_demolished_car_rows_drop_out():
+    data = replay_csv(GAP_REPLAY)
+    frames = data["time"].unique()
+    bob = data.loc[data["player_name"] == "Bob", "time"].to_numpy()
+    assert np.array_equal(bob, np.concatenate([frames[:15], frames[25:]]))
+
+
+def test_timeline_matches_csv():
+    timeline = RattlePlayer(GAP_REPLAY).generate_timeline()
+    csv = replay_csv(GAP_REPLAY)
+    frame = timeline.to_frame()
+    assert np.allclose(frame["distance_to_ball"], csv["distance_to_ball"], equal_nan=True)
+
+    # frames without a ball have no distance rather than a stand-in one
+    timeline.present[:5, 0] = False
+    timeline.derive()
+    assert np.isnan(timeline.distance_to_ball[:5]).all()
+    assert not np.isnan(timeline.distance_to_ball[5:, 1:][timeline.present[5:, 1:5]]).any()
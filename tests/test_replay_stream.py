@@ -0,0 +1,65 @@
+import io
+import json
+import os
+
+import pytest
+
+from conftest import FIXTURES
+from rattleplayer import RattlePlayer
+from replay_stream import ReplayStream, read_json_header
+
+# keys sorted like rattletrap writes them, content before header
+SORTED_REPLAY = os.path.join(FIXTURES, "sorted_keys.replay.json")
+
+
+def header_first(path, tmp_path):
+    with open(path, encoding="utf-8") as f:
+        replay = json.load(f)
+    reordered = tmp_path / "header_first.replay.json"
+    reordered.write_text(json.dumps({"header": replay["header"], "content": replay["content"]}))
+    return str(reordered)
+
+
+def test_sorted_keys_stream():
+    with open(SORTED_REPLAY, encoding="utf-8") as f:
+        replay = json.load(f)
+    with ReplayStream(open(SORTED_REPLAY, encoding="utf-8"), chunk_size=1024) as stream:
+        assert stream.header == replay["header"]
+        assert list(stream.frames()) == replay["content"]["body"]["frames"]
+
+
+def test_csv_same_in_any_key_order(tmp_path):
+    with RattlePlayer(SORTED_REPLAY, stream=True) as player:
+        streamed = player.generate_csv()
+    with RattlePlayer(header_first(SORTED_REPLAY, tmp_path), stream=True) as player:
+        assert player.generate_csv() == streamed
+    assert RattlePlayer(SORTED_REPLAY).generate_csv() == streamed
+
+
+def test_header_after_frames_of_a_pipe():
+    with open(SORTED_REPLAY, encoding="utf-8") as f:
+        text = f.read()
+
+    class Pipe(io.StringIO):
+        def seekable(self):
+            return False
+
+    with pytest.raises(ValueError, match="header after the frames"):
+        ReplayStream(Pipe(text))
+    header = json.loads(text)["header"]
+    with ReplayStream(Pipe(text), header=header) as stream:
+        assert len(list(stream.frames())) == len(json.loads(text)["content"]["body"]["frames"])
+
+
+def test_json_header_without_frames(tmp_path):
+    with open(SORTED_REPLAY, encoding="utf-8") as f:
+        text = f.read()
+    header = json.loads(text)["header"]
+    assert read_json_header(SORTED_REPLAY) == header
+    assert read_json_header(header_first(SORTED_REPLAY, tmp_path)) == header
+
+    # the frames are not decoded, so broken ones do not matter
+    frames = text.index('"frames":') + len('"frames":')
+    broken = tmp_path / "broken_frames.replay.json"
+    broken.write_text(text[:frames] + "[{broken" + text[frames + 8:])
+    assert read_json_header(str(broken)) == header
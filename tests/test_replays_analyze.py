@@ -0,0 +1,10 @@
+import importlib
+import sys
+
+
+def test_import_creates_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sys.modules.pop("replays_analyze", None)
+    importlib.import_module("replays_analyze")
+
+    assert list(tmp_path.iterdir()) == []
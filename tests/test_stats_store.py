@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+
+from conftest import FIXTURES
+from rattleplayer import RattlePlayer
+from stats_store import StatsStore, match_record
+
+REPLAY = os.path.join(FIXTURES, "sorted_keys.replay.json")
+
+
+def parsed_record():
+    player = RattlePlayer(REPLAY)
+    timeline = player.generate_timeline()
+    return match_record(os.path.basename(REPLAY), player.game, timeline), timeline
+
+
+def test_negative_coordinates_are_stored(tmp_path):
+    record, timeline = parsed_record()
+    with StatsStore(str(tmp_path / "stats.db")) as store:
+        store.add_matches([record], timelines=True)
+        samples = store.timeline(record["match_guid"])
+
+    assert samples
+    assert all(sample["time"] is not None for sample in samples)
+    assert any(sample["location_x"] is not None and sample["location_x"] < 0 for sample in samples)
+    frames = {float(time): frame for frame, time in enumerate(timeline.time)}
+    for sample in samples:
+        entity = timeline.entities.index(sample["player_name"])
+        x, y, z = timeline.position[frames[sample["time"]], entity]
+        assert (sample["location_x"], sample["location_y"], sample["location_z"]) == (x, y, z)
+
+
+def test_players_sharing_a_name_are_kept(tmp_path):
+    record, _ = parsed_record()
+    for player in record["players"]:
+        player["player_name"] = "unknown player"
+    with StatsStore(str(tmp_path / "stats.db")) as store:
+        store.add_matches([record])
+        history = store.player_history("unknown player")
+
+    assert len(record["players"]) > 1
+    assert sorted(row["entity"] for row in history) == sorted(player["entity"] for player in record["players"])
+
+
+def test_distances_without_ball_left_out(tmp_path):
+    player = RattlePlayer(REPLAY)
+    timeline = player.generate_timeline()
+    timeline.present[:10, 0] = False
+    timeline.derive()
+    record = match_record(os.path.basename(REPLAY), player.game, timeline)
+
+    for stats in record["players"]:
+        entity = stats["entity"]
+        present = timeline.present[10:, entity]
+        expected = np.nanmean(timeline.distance_to_ball[10:, entity][present])
+        assert np.isclose(stats["avg_distance_to_ball"], expected)
+    no_ball = set(timeline.time[:10].tolist())
+    distance = 8
+    assert all(sample[distance] is None for sample in record["samples"] if sample[2] in no_ball)
+    assert all(sample[distance] is not None for sample in record["samples"] if sample[2] not in no_ball and sample[0])
+
+
+def test_match_filters(tmp_path):
+    record, _ = parsed_record()
+    for player in record["players"]:
+        player["player_name"] = "unknown player"
+    day = record["date"][:10]
+    with StatsStore(str(tmp_path / "stats.db")) as store:
+        store.add_matches([record])
+        assert len(store.matches(player="unknown player")) == 1
+        # an until date takes in the whole day
+        assert len(store.matches(since=day, until=day)) == 1
+        assert store.matches(until=record["date"])
+        assert not store.matches(since=day + "T23:59:59")